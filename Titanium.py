@@ -2,11 +2,3139 @@ import sublime
 import sublime_plugin
 import json
 import subprocess
+import os
+import time
+import hashlib
+import threading
+import re
+import math
+import codecs
+import signal
+import shutil
+import collections
+import mmap
+import struct
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 from os.path import expanduser
 
+#Bump this whenever the format of the cached environment info changes
+ENVIRONMENT_CACHE_VERSION = 4
+
+#Platforms that need environment info (devices, emulators, certificates) to build
+ENVIRONMENT_PLATFORMS = ["android", "ios"]
+
+#Slow CLI calls run on this pool so they never block Sublime's UI thread
+workerPool = ThreadPoolExecutor(max_workers=4)
+
+#Background prewarming runs one low priority CLI call at a time
+prewarmPool = ThreadPoolExecutor(max_workers=1)
+
+#Loads that are queued or running, keyed by what they load, so that
+#several windows (or a build and a prewarm) share a single CLI process.
+#Each entry holds the load's future, and whether it was submitted by prewarming
+inflightLoads = {}
+inflightLock = threading.RLock()
+
+#Parsed tiapp.xml files, keyed by project folder
+#Each entry holds the tiapp.xml mtime it was parsed at, and the parsed values
+tiappCache = {}
+
+#Minimum number of seconds between two prewarms of the same window
+PREWARM_INTERVAL = 60
+
+#Seconds after which the CLI session is checked again, in case it has expired or another user has logged in
+SESSION_CHECK_INTERVAL = 3600
+
+#When the CLI session of each (appc, user) was last checked
+activeSessions = {}
+sessionLock = threading.Lock()
+
+#Options whose value is a secret, and is hidden when a command is printed
+SECRET_OPTIONS = ["--password", "--store-password", "--key-password"]
+
+
+#---------------------------------------------------------------------------
+# BACKGROUND LOADING
+# Runs CLI calls on a worker pool, sharing calls that are already in flight
+#---------------------------------------------------------------------------
+
+#Submits fn to the pool, unless a load with the same key is already queued or running.
+#Interactive loads (lowPriority False) take over loads that are still waiting in the prewarm queue.
+def submit_load(key, lowPriority, fn, *args):
+    with inflightLock:
+        future, prewarming = inflightLoads.get(key, (None, False))
+        #Only loads waiting in the prewarm queue are taken over. Other callers may be waiting for an interactive load
+        if future is not None and prewarming and not lowPriority and future.cancel():
+            future = None
+
+        if future is None:
+            pool = prewarmPool if lowPriority else workerPool
+            future = pool.submit(fn, *(args + (lowPriority,)))
+            inflightLoads[key] = (future, lowPriority)
+            future.add_done_callback(lambda f: forget_load(key, f))
+
+        return future
+
+#Returns a future that already holds the value, for values that don't need to be loaded
+def completed_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def forget_load(key, future):
+    with inflightLock:
+        if inflightLoads.get(key, (None, False))[0] is future:
+            del inflightLoads[key]
+
+#Starts a CLI command with its output piped. Low priority commands are niced so they don't slow down the editor.
+#The CLI gets no input unless stdin is piped, so it fails instead of waiting for an answer to a prompt
+def open_cli(cmd, lowPriority=False, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL):
+    preexec = None
+    if lowPriority and hasattr(os, "nice"):
+        preexec = lambda: os.nice(10)
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, stdin=stdin, preexec_fn=preexec)
+
+#Runs a CLI command and returns its output
+def run_cli(cmd, lowPriority=False):
+    process = open_cli(cmd, lowPriority)
+    result, error = process.communicate()
+    return result.decode('utf-8')
+
+#Returns the command as text, with passwords hidden
+def format_command(cmd):
+    return ' '.join("********" if i > 0 and cmd[i - 1] in SECRET_OPTIONS else arg for i, arg in enumerate(cmd))
+
+
+#---------------------------------------------------------------------------
+# SESSION
+# The CLI keeps the session of the last login, so the plugin logs in once
+# and then runs every command without credentials
+#---------------------------------------------------------------------------
+
+#Returns the user the CLI is logged in as, or None when it isn't logged in
+def get_session_user(appc, lowPriority=False):
+    try:
+        session = json.loads(run_cli([appc, "whoami", "-o", "json", "--no-banner"], lowPriority))
+    except ValueError:
+        return None
+    return session.get("username") if isinstance(session, dict) else None
+
+#Logs the CLI in as the user, unless it already is. The password is only ever passed to appc login,
+#which prompts for it and reads it from stdin, so it never shows up in the process list
+def ensure_session(appc, user, password, lowPriority=False):
+    with sessionLock:
+        checked = activeSessions.get((appc, user))
+        if checked is not None and time.time() - checked < SESSION_CHECK_INTERVAL:
+            return
+
+        if get_session_user(appc, lowPriority) != user:
+            process = open_cli([appc, "login", "--username", user, "--no-banner"], lowPriority, stdin=subprocess.PIPE)
+            result, error = process.communicate((password + "\n").encode("utf-8"))
+            if process.returncode != 0:
+                raise Exception("Unable to log in as " + user + "\n\n" + (error or result).decode("utf-8", "replace").strip())
+
+        #There is a single session, so logging in as one user logs the others out
+        activeSessions.clear()
+        activeSessions[(appc, user)] = time.time()
+
+def load_session(appc, user, password, lowPriority=False):
+    return submit_load(("session", appc, user), lowPriority, ensure_session, appc, user, password)
+
+def is_titanium_project(folder):
+    return os.path.isfile(os.path.join(folder, "tiapp.xml"))
+
+#Reads the app info out of a project's tiapp.xml.
+#Returns None if the file is missing or invalid. The file is only parsed again after it changes
+def read_tiapp(folder):
+    path = os.path.join(folder, "tiapp.xml")
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    cached = tiappCache.get(folder)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        root = ElementTree.parse(path).getroot()
+        tiapp = {
+            "id": (root.findtext("id") or "").strip(),
+            "name": (root.findtext("name") or "").strip(),
+            "version": (root.findtext("version") or "").strip(),
+            "sdk-version": (root.findtext("sdk-version") or "").strip()
+        }
+    except (ElementTree.ParseError, IOError, OSError):
+        tiapp = None
+
+    tiappCache[folder] = (mtime, tiapp)
+    return tiapp
+
+#Gets the Titanium SDK the project uses from its tiapp.xml,
+#falling back to appc ti project when the tiapp.xml can't be read
+def get_sdk_version(appc, user, password, folder, lowPriority=False):
+    tiapp = read_tiapp(folder)
+    if tiapp is not None and tiapp["sdk-version"] != "":
+        return tiapp["sdk-version"]
+
+    ensure_session(appc, user, password, lowPriority)
+    result = run_cli([appc, "ti", "project", "sdk-version", "--project-dir", folder, "--output=text", "--no-banner"], lowPriority)
+    return result.rstrip('\n')
+
+#Gets the project's app version from its tiapp.xml,
+#falling back to appc ti project when the tiapp.xml can't be read
+def get_project_version(appc, user, password, folder, lowPriority=False):
+    tiapp = read_tiapp(folder)
+    if tiapp is not None and tiapp["version"] != "":
+        return tiapp["version"]
+
+    ensure_session(appc, user, password, lowPriority)
+    result = run_cli([appc, "ti", "project", "version", "--project-dir", folder, "--output=text", "--no-banner"], lowPriority)
+    return result.rstrip('\n')
+
+def load_sdk_version(appc, user, password, folder, lowPriority=False):
+    return submit_load(("sdk", folder), lowPriority, get_sdk_version, appc, user, password, folder)
+
+def load_project_version(appc, user, password, folder, lowPriority=False):
+    return submit_load(("version", folder), lowPriority, get_project_version, appc, user, password, folder)
+
+def load_environment_info(appc, user, password, ttl, platform, lowPriority=False):
+    return submit_load(("environment", appc, user, platform), lowPriority, get_environment_info, appc, user, password, ttl, platform)
+
+
+#---------------------------------------------------------------------------
+# ENVIRONMENT CACHE
+# `appc ti info` is slow, so the parsed result is cached on disk and reused
+# until it expires or the keychains, provisioning profiles or emulators change
+#---------------------------------------------------------------------------
+
+#Folder inside of Sublime's cache directory where this package stores its data
+def get_cache_folder():
+    folder = os.path.join(sublime.cache_path(), "Titanium Build")
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    return folder
+
+#Directories that change when certificates, provisioning profiles or android emulators are added or removed
+def get_environment_watch_paths(platform):
+    home = expanduser("~")
+    if platform == "ios":
+        return [
+            home + "/Library/Keychains",
+            home + "/Library/MobileDevice/Provisioning Profiles"
+        ]
+    return [home + "/.android/avd"]
+
+def get_environment_mtimes(platform):
+    mtimes = {}
+    for path in get_environment_watch_paths(platform):
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+#The cache is keyed by the CLI being used, the account it's used with and the platform
+def get_environment_cache_file(appc, user, platform):
+    key = hashlib.sha1((appc + "\n" + user).encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_folder(), "environment-" + platform + "-" + key + ".json")
+
+#Returns the cached environment info, or None if there is no cache or it is no longer valid
+def read_environment_cache(appc, user, ttl, platform):
+    if ttl <= 0:
+        return None
+
+    try:
+        with open(get_environment_cache_file(appc, user, platform), "r") as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if cache.get("version") != ENVIRONMENT_CACHE_VERSION:
+        return None
+    if time.time() - cache.get("created", 0) > ttl:
+        return None
+    if cache.get("mtimes") != get_environment_mtimes(platform):
+        return None
+
+    return ENVIRONMENT_CLASSES[platform].from_cache(cache["info"])
+
+def write_environment_cache(appc, user, platform, env):
+    cache = {
+        "version": ENVIRONMENT_CACHE_VERSION,
+        "created": time.time(),
+        "mtimes": get_environment_mtimes(platform),
+        "info": env.to_cache()
+    }
+    path = get_environment_cache_file(appc, user, platform)
+    #Write to a temp file first so a half written cache is never read
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        print("Titanium: unable to write environment cache: " + str(e))
+
+def clear_environment_cache():
+    folder = get_cache_folder()
+    for name in os.listdir(folder):
+        if name.startswith("environment-"):
+            os.remove(os.path.join(folder, name))
+
+#Uses appc info to get info about the devices, emulators, certificates and such that are installed for a single platform
+def fetch_environment_info(appc, user, password, platform, lowPriority=False):
+    ensure_session(appc, user, password, lowPriority)
+    cmd = [appc, "ti", "info", "-t", platform, "-o", "json", "--no-banner"]
+    print("RUNNING COMMAND")
+    print(format_command(cmd))
+
+    #The output is parsed while it streams in, and only the parts the environment model uses are kept
+    process = open_cli(cmd, lowPriority, subprocess.DEVNULL)
+    try:
+        info = JsonStreamReader(process.stdout).parse(ENVIRONMENT_SELECTORS[platform])
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if platform == "ios":
+        return parse_ios_info(info["ios"])
+    return parse_android_info(info["android"])
+
+def parse_android_info(info):
+    return AndroidEnvironment(
+        [AndroidEmulator.from_info(obj) for obj in info["emulators"]],
+        [AndroidDevice.from_info(obj) for obj in info.get("devices", [])])
+
+def parse_ios_info(info):
+    simulators = []
+    for name, arr in list(info["simulators"]["ios"].items()):
+        for sim in arr:
+            simulators.append(IosSimulator.from_info(sim))
+
+    keychain = info["certs"]["keychains"][expanduser("~") + "/Library/Keychains/login.keychain"]
+    certs = {}
+    for category in IosEnvironment.CERT_CATEGORIES:
+        certs[category] = [IosCertificate.from_info(cert) for cert in keychain[category] if cert['expired'] is False]
+
+    profiles = {}
+    for category in IosEnvironment.PROFILE_CATEGORIES:
+        profiles[category] = [ProvisioningProfile.from_info(profile) for profile in info["provisioning"][category] if profile['expired'] is False]
+
+    return IosEnvironment(
+        [IosDevice.from_info(device) for device in info["devices"]],
+        simulators,
+        certs,
+        profiles)
+
+
+#---------------------------------------------------------------------------
+# ENVIRONMENT MODEL
+# Only the fields the build dialogs use are kept from the `ti info` output.
+# Each item serializes to a plain list, in the order of its __slots__
+#---------------------------------------------------------------------------
+
+class EnvironmentItem(object):
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for key, value in zip(self.__slots__, values):
+            setattr(self, key, value)
+
+    @classmethod
+    def from_info(cls, info):
+        return cls(*[info.get(key, "") for key in cls.INFO_KEYS])
+
+    def to_list(self):
+        return [getattr(self, key) for key in self.__slots__]
+
+class AndroidEmulator(EnvironmentItem):
+    __slots__ = ("name", "sdkVersion", "type")
+    INFO_KEYS = ("name", "sdk-version", "type")
+
+class AndroidDevice(EnvironmentItem):
+    __slots__ = ("id", "brand", "manufacturer", "model", "release")
+    INFO_KEYS = __slots__
+
+class IosDevice(EnvironmentItem):
+    __slots__ = ("udid", "name", "deviceClass", "productType", "productVersion")
+    INFO_KEYS = __slots__
+
+class IosSimulator(EnvironmentItem):
+    __slots__ = ("udid", "deviceName", "version")
+    INFO_KEYS = __slots__
+
+class IosCertificate(EnvironmentItem):
+    __slots__ = ("name", "fullname")
+    INFO_KEYS = __slots__
+
+class ProvisioningProfile(EnvironmentItem):
+    __slots__ = ("uuid", "name", "appId")
+    INFO_KEYS = __slots__
+
+    #Profiles can be for a single app id, or a wildcard such as com.example.*
+    def matches(self, appId):
+        if self.appId.endswith("*"):
+            return appId.startswith(self.appId[:-1])
+        return self.appId == appId
+
+
+class AndroidEnvironment(object):
+    __slots__ = ("emulators", "devices", "emulatorOptions", "deviceOptions")
+
+    def __init__(self, emulators, devices):
+        self.emulators = emulators
+        self.devices = devices
+
+        self.emulatorOptions = []
+        for obj in emulators:
+            subtitle = "Android " + obj.sdkVersion + " (" + obj.type + ")"
+            self.emulatorOptions.append([obj.name, subtitle])
+
+        self.deviceOptions = []
+        for obj in devices:
+            name = obj.brand + " " + obj.manufacturer + " (" + obj.model + ") Android " + obj.release
+            self.deviceOptions.append([name, obj.id])
+
+    def to_cache(self):
+        return {
+            "emulators": [obj.to_list() for obj in self.emulators],
+            "devices": [obj.to_list() for obj in self.devices]
+        }
+
+    @classmethod
+    def from_cache(cls, data):
+        return cls(
+            [AndroidEmulator(*values) for values in data["emulators"]],
+            [AndroidDevice(*values) for values in data["devices"]])
+
+class IosEnvironment(object):
+    __slots__ = ("devices", "simulators", "certs", "profiles", "simulatorOptions", "deviceOptions", "certOptions", "profileOptions", "profilesByAppId")
+
+    CERT_CATEGORIES = ["developer", "distribution"]
+    PROFILE_CATEGORIES = ["development", "distribution", "adhoc"]
+
+    #certs and profiles are dicts of non expired items, by category
+    def __init__(self, devices, simulators, certs, profiles):
+        self.devices = devices
+        self.simulators = simulators
+        self.certs = certs
+        self.profiles = profiles
+
+        self.simulatorOptions = [[obj.deviceName + " - iOS " + obj.version, obj.udid] for obj in simulators]
+
+        #Device options by device class. "universal" holds all of the devices,
+        #and "" the devices that don't report a class
+        self.deviceOptions = {"universal": []}
+        for obj in devices:
+            name = obj.name
+            if obj.deviceClass != "":
+                name = obj.deviceClass + " - " + name
+            if obj.productType != "":
+                name += " (" + obj.productType + ")"
+            if obj.productVersion != "":
+                name += " iOS " + obj.productVersion
+
+            option = [name, obj.udid]
+            self.deviceOptions["universal"].append(option)
+            self.deviceOptions.setdefault(obj.deviceClass, []).append(option)
+
+        self.certOptions = {}
+        for category, arr in certs.items():
+            self.certOptions[category] = [[obj.fullname, obj.name] for obj in arr]
+
+        self.profileOptions = {}
+        self.profilesByAppId = {}
+        for category, arr in profiles.items():
+            self.profileOptions[category] = []
+            self.profilesByAppId[category] = {}
+            for obj in arr:
+                self.profileOptions[category].append([obj.name + " (" + obj.appId + ")", obj.uuid])
+                self.profilesByAppId[category].setdefault(obj.appId, []).append(obj)
+
+    def get_device_options(self, family):
+        if family == "universal":
+            return self.deviceOptions["universal"]
+
+        #Devices that don't report a class can be used for any family
+        return self.deviceOptions.get(family, []) + self.deviceOptions.get("", [])
+
+    #Returns the profile options that can sign the given app id,
+    #or all of the category's profile options when none of them match
+    def get_profile_options(self, category, appId):
+        matching = []
+        for profileAppId, arr in self.profilesByAppId[category].items():
+            if arr[0].matches(appId):
+                matching.extend(arr)
+
+        if len(matching) == 0:
+            return self.profileOptions[category]
+        return [[obj.name + " (" + obj.appId + ")", obj.uuid] for obj in matching]
+
+    def to_cache(self):
+        return {
+            "devices": [obj.to_list() for obj in self.devices],
+            "simulators": [obj.to_list() for obj in self.simulators],
+            "certs": dict((category, [obj.to_list() for obj in arr]) for category, arr in self.certs.items()),
+            "profiles": dict((category, [obj.to_list() for obj in arr]) for category, arr in self.profiles.items())
+        }
+
+    @classmethod
+    def from_cache(cls, data):
+        return cls(
+            [IosDevice(*values) for values in data["devices"]],
+            [IosSimulator(*values) for values in data["simulators"]],
+            dict((category, [IosCertificate(*values) for values in arr]) for category, arr in data["certs"].items()),
+            dict((category, [ProvisioningProfile(*values) for values in arr]) for category, arr in data["profiles"].items()))
+
+ENVIRONMENT_CLASSES = {"android": AndroidEnvironment, "ios": IosEnvironment}
+
+def select_keys(keys):
+    return dict((key, True) for key in keys)
+
+#The parts of the `ti info` output that are parsed for each platform. See JsonStreamReader
+ENVIRONMENT_SELECTORS = {
+    "android": {
+        "android": {
+            "emulators": select_keys(AndroidEmulator.INFO_KEYS),
+            "devices": select_keys(AndroidDevice.INFO_KEYS)
+        }
+    },
+    "ios": {
+        "ios": {
+            "devices": select_keys(IosDevice.INFO_KEYS),
+            "simulators": {"ios": {"*": select_keys(IosSimulator.INFO_KEYS)}},
+            "certs": {"keychains": {"*": dict((category, select_keys(IosCertificate.INFO_KEYS + ("expired",))) for category in IosEnvironment.CERT_CATEGORIES)}},
+            "provisioning": dict((category, select_keys(ProvisioningProfile.INFO_KEYS + ("expired",))) for category in IosEnvironment.PROFILE_CATEGORIES)
+        }
+    }
+}
+
+
+#---------------------------------------------------------------------------
+# STREAMING JSON
+# `ti info` prints megabytes of JSON (provisioning profiles carry their
+# entitlements and certificates) of which only a small part is used
+#---------------------------------------------------------------------------
+
+JSON_WHITESPACE = re.compile(r'[ \t\r\n]*')
+JSON_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"')
+#Everything up to the next bracket, including whole strings
+JSON_SKIPPABLE = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+#Numbers, true, false and null. json.loads validates the token
+JSON_SCALAR = re.compile(r'[\w.+-]+')
+
+#Parses JSON from a stream as it is read, keeping only the parts of the document picked by a selector.
+#A selector is True to keep a whole value, or a dict of key to selector, where "*" matches any key.
+#Arrays apply their selector to each item. Everything else is skipped without being decoded
+class JsonStreamReader(object):
+
+    def __init__(self, stream, chunkSize=65536):
+        self.stream = stream
+        self.read = getattr(stream, "read1", stream.read)
+        self.chunkSize = chunkSize
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def parse(self, selector=True):
+        return self.value(selector)
+
+    #Reads the next chunk into the buffer, dropping the text that has already been parsed
+    def fill(self):
+        if self.eof:
+            raise ValueError("Unexpected end of JSON input")
+
+        chunk = self.read(self.chunkSize)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + self.decoder.decode(chunk, self.eof)
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.fill()
+
+    #Matches a token at the current position, reading more input until the token can't be any longer
+    def match(self, pattern):
+        while True:
+            m = pattern.match(self.buffer, self.pos)
+            if m is not None and (m.end() < len(self.buffer) or self.eof):
+                self.pos = m.end()
+                return m
+            if m is None and self.eof:
+                raise ValueError("Invalid JSON at: " + self.buffer[self.pos:self.pos + 20])
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected '" + char + "' at: " + self.buffer[self.pos:self.pos + 20])
+        self.pos += 1
+
+    def value(self, selector):
+        c = self.peek()
+        if c == "{":
+            return self.object(selector)
+        if c == "[":
+            return self.array(selector)
+        if c == '"':
+            return json.loads(self.match(JSON_STRING).group(0))
+        return json.loads(self.match(JSON_SCALAR).group(0))
+
+    def object(self, selector):
+        self.pos += 1
+        result = {}
+        if self.peek() == "}":
+            self.pos += 1
+            return result
+
+        while True:
+            self.peek()
+            key = json.loads(self.match(JSON_STRING).group(0))
+            self.expect(":")
+
+            if selector is True:
+                result[key] = self.value(True)
+            else:
+                keySelector = selector.get(key, selector.get("*"))
+                if keySelector is None:
+                    self.skip()
+                else:
+                    result[key] = self.value(keySelector)
+
+            c = self.peek()
+            self.pos += 1
+            if c == "}":
+                return result
+            if c != ",":
+                raise ValueError("Expected ',' or '}' at: " + self.buffer[self.pos - 1:self.pos + 20])
+
+    def array(self, selector):
+        self.pos += 1
+        result = []
+        if self.peek() == "]":
+            self.pos += 1
+            return result
+
+        while True:
+            result.append(self.value(selector))
+            c = self.peek()
+            self.pos += 1
+            if c == "]":
+                return result
+            if c != ",":
+                raise ValueError("Expected ',' or ']' at: " + self.buffer[self.pos - 1:self.pos + 20])
+
+    #Skips over a value, only looking at the brackets that open and close objects and arrays
+    def skip(self):
+        c = self.peek()
+        if c == '"':
+            self.match(JSON_STRING)
+            return
+        if c != "{" and c != "[":
+            self.match(JSON_SCALAR)
+            return
+
+        depth = 0
+        while True:
+            self.pos = JSON_SKIPPABLE.match(self.buffer, self.pos).end()
+            #Stopping at a quote means the string continues in the next chunk
+            if self.pos >= len(self.buffer) or self.buffer[self.pos] == '"':
+                self.fill()
+                continue
+
+            c = self.buffer[self.pos]
+            self.pos += 1
+            if c == "{" or c == "[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+#Returns the environment info for a platform from the cache when possible, otherwise loads it with the CLI and caches it
+def get_environment_info(appc, user, password, ttl, platform, lowPriority=False):
+    env = read_environment_cache(appc, user, ttl, platform)
+    if env is None:
+        env = fetch_environment_info(appc, user, password, platform, lowPriority)
+        if ttl > 0:
+            write_environment_cache(appc, user, platform, env)
+    return env
+
+
+#---------------------------------------------------------------------------
+# PROJECT INDEX
+# The Titanium projects in the open folders, including apps nested below them,
+# along with the tiapp.xml values the build dialogs show. The index is cached
+# on disk, so the folders are only searched again in the background
+#---------------------------------------------------------------------------
+
+PROJECT_INDEX_FILE = "projects.json"
+
+#Seconds after which an open folder is searched again for projects that were added or removed
+PROJECT_SCAN_INTERVAL = 300
+
+#Folders that never hold a Titanium project
+PROJECT_SEARCH_SKIP = ["node_modules", "build", "dist", "Resources", "app", "platform", "modules", "plugins", "i18n"]
+
+#The projects found in each open folder, as {folder: {"scanned": time, "projects": [[path, tiapp.xml mtime, tiapp values]]}}.
+#Read from the cache file the first time it is used
+projectIndex = None
+projectIndexLock = threading.RLock()
+
+class ProjectEntry(object):
+    __slots__ = ["path", "name", "appId", "sdkVersion", "version"]
+
+    def __init__(self, path, tiapp):
+        self.path = path
+        self.name = tiapp["name"] if tiapp is not None and tiapp["name"] != "" else os.path.basename(path)
+        self.appId = tiapp["id"] if tiapp is not None else ""
+        self.sdkVersion = tiapp["sdk-version"] if tiapp is not None else ""
+        self.version = tiapp["version"] if tiapp is not None else ""
+
+#Returns the Titanium projects in the folder, searching up to depth folders below it.
+#The folders of a project aren't searched for other projects
+def find_projects(folder, depth):
+    if is_titanium_project(folder):
+        return [folder]
+    if depth <= 0:
+        return []
+
+    projects = []
+    try:
+        names = sorted(os.listdir(folder))
+    except OSError:
+        return projects
+    for name in names:
+        path = os.path.join(folder, name)
+        if not name.startswith(".") and name not in PROJECT_SEARCH_SKIP and os.path.isdir(path):
+            projects.extend(find_projects(path, depth - 1))
+    return projects
+
+def get_project_index():
+    global projectIndex
+    with projectIndexLock:
+        if projectIndex is None:
+            projectIndex = {}
+            try:
+                with open(os.path.join(get_cache_folder(), PROJECT_INDEX_FILE), "r") as f:
+                    projectIndex = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+            #The cached tiapp.xml values are used until the file changes
+            for folder in projectIndex.values():
+                for path, mtime, tiapp in folder["projects"]:
+                    if path not in tiappCache:
+                        tiappCache[path] = (mtime, tiapp)
+        return projectIndex
+
+#Writes the index of the folders that are open in any window
+def write_project_index():
+    openFolders = set(folder for window in sublime.windows() for folder in window.folders())
+    with projectIndexLock:
+        index = dict((folder, entry) for folder, entry in get_project_index().items() if folder in openFolders)
+    path = os.path.join(get_cache_folder(), PROJECT_INDEX_FILE)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        print("Titanium: unable to write project index: " + str(e))
+
+#Searches the folder for projects and stores them, along with their tiapp.xml values, in the index
+def scan_projects(folder, depth, lowPriority=False):
+    projects = []
+    for path in find_projects(folder, depth):
+        tiapp = read_tiapp(path)
+        cached = tiappCache.get(path)
+        if tiapp is not None and cached is not None:
+            projects.append([path, cached[0], tiapp])
+
+    with projectIndexLock:
+        get_project_index()[folder] = {"scanned": time.time(), "projects": projects}
+    write_project_index()
+    return projects
+
+def load_projects(folder, depth, lowPriority=False):
+    return submit_load(("projects", folder), lowPriority, scan_projects, folder, depth)
+
+#Returns the Titanium projects in the window's folders, along with the futures of the folders that haven't been searched yet.
+#The folders are searched in parallel. Folders searched more than PROJECT_SCAN_INTERVAL seconds ago are searched again in the background
+def get_window_projects(window):
+    depth = sublime.load_settings('Titanium.sublime-settings').get("projectSearchDepth", 3)
+    projects = []
+    pending = []
+    paths = set()
+    now = time.time()
+    for folder in window.folders():
+        with projectIndexLock:
+            cached = get_project_index().get(folder)
+        if cached is None:
+            pending.append(load_projects(folder, depth))
+            continue
+        if now - cached["scanned"] > PROJECT_SCAN_INTERVAL:
+            load_projects(folder, depth, True)
+
+        for path, mtime, tiapp in cached["projects"]:
+            #Picks up tiapp.xml changes, only parsing the files that have changed
+            tiapp = read_tiapp(path)
+            if tiapp is not None and path not in paths:
+                paths.add(path)
+                projects.append(ProjectEntry(path, tiapp))
+    return projects, pending
+
+#Returns the window's folders, along with the projects nested in them that are already in the index
+def get_project_paths(window):
+    paths = list(window.folders())
+    with projectIndexLock:
+        index = get_project_index()
+        for folder in window.folders():
+            for path, mtime, tiapp in index.get(folder, {}).get("projects", []):
+                if path not in paths:
+                    paths.append(path)
+    return paths
+
+
+#---------------------------------------------------------------------------
+# BUILD PRESETS
+# Resolved build options, saved per project so a build can be run again
+# without any dialogs or environment loading. Passwords are never stored
+#---------------------------------------------------------------------------
+
+PRESETS_FILE = "Titanium Presets.sublime-settings"
+
+#The build options that make up a preset
+PRESET_KEYS = ["platform", "target", "deviceID", "family", "iosCert", "iosProvisioningProfile", "androidKeystore", "keyAlias", "deployType"]
+
+def get_project_presets(folder):
+    projects = sublime.load_settings(PRESETS_FILE).get("projects", {})
+    return projects.get(folder, {})
+
+def save_project_preset(folder, name, preset):
+    settings = sublime.load_settings(PRESETS_FILE)
+    projects = settings.get("projects", {})
+    projects.setdefault(folder, {})[name] = preset
+    settings.set("projects", projects)
+    sublime.save_settings(PRESETS_FILE)
+
+def delete_project_preset(folder, name):
+    settings = sublime.load_settings(PRESETS_FILE)
+    projects = settings.get("projects", {})
+    if name in projects.get(folder, {}):
+        del projects[folder][name]
+        if len(projects[folder]) == 0:
+            del projects[folder]
+        settings.set("projects", projects)
+        sublime.save_settings(PRESETS_FILE)
+
+#Returns the presets of all the given folders as a list of [folder, name, preset]
+def get_presets(folders):
+    presets = []
+    for folder in folders:
+        for name, preset in sorted(get_project_presets(folder).items()):
+            presets.append([folder, name, preset])
+    return presets
+
+#The most recent build is stored like a preset, along with the project it was built for
+def get_most_recent_build(folders):
+    mostRecent = sublime.load_settings(PRESETS_FILE).get("mostRecent")
+    if mostRecent is None or mostRecent.get("project") not in folders:
+        return None
+    return mostRecent
+
+def set_most_recent_build(folder, preset):
+    mostRecent = dict(preset)
+    mostRecent["project"] = folder
+    settings = sublime.load_settings(PRESETS_FILE)
+    settings.set("mostRecent", mostRecent)
+    sublime.save_settings(PRESETS_FILE)
+
+#Suggests a name for a preset, such as "android emulator Pixel_5"
+def get_preset_name(preset):
+    parts = [preset["platform"], preset["target"]]
+    if preset.get("deviceName", "") != "":
+        parts.append(preset["deviceName"])
+    elif preset.get("family", "") != "" and preset["platform"] == "ios":
+        parts.append(preset["family"])
+    elif preset.get("deployType", "") != "":
+        parts.append(preset["deployType"])
+    return " ".join(parts)
+
+#Checks that the signing identity used by an ios preset is still installed.
+#Only the referenced profile and certificate are checked, using the cached environment info when there is one.
+#Returns an error message, or None if the preset can be used
+def verify_ios_signing(appc, user, ttl, preset):
+    if preset["target"] == "simulator":
+        return None
+
+    profile = expanduser("~") + "/Library/MobileDevice/Provisioning Profiles/" + preset["iosProvisioningProfile"] + ".mobileprovision"
+    if not os.path.isfile(profile):
+        return "The provisioning profile " + preset["iosProvisioningProfile"] + " is not installed"
+
+    env = read_environment_cache(appc, user, ttl, "ios")
+    if env is not None:
+        certs = env.certs["developer"] if preset["target"] == "device" else env.certs["distribution"]
+        if preset["iosCert"] not in [cert.name for cert in certs]:
+            return "The certificate " + preset["iosCert"] + " is not installed or has expired"
+
+    return None
+
+
+class TitaniumSavePresetCommand(sublime_plugin.WindowCommand):
+
+    #Saves the most recent build of one of the window's projects as a named preset
+    def run(self):
+        self.mostRecent = get_most_recent_build(get_project_paths(self.window))
+        if self.mostRecent is None:
+            sublime.error_message("Titanium: Run a build first, then save it as a preset")
+            return
+
+        self.window.show_input_panel("Preset Name", get_preset_name(self.mostRecent), self.save, None, None)
+
+    def save(self, name):
+        if name == "":
+            return
+
+        preset = dict((key, self.mostRecent.get(key, "")) for key in PRESET_KEYS + ["deviceName"])
+        save_project_preset(self.mostRecent["project"], name, preset)
+        sublime.status_message("Titanium: saved preset \"" + name + "\"")
+
+
+class TitaniumRunPresetCommand(sublime_plugin.WindowCommand):
+
+    #Shows the presets of the window's projects and runs the one that is picked
+    def run(self):
+        self.presets = get_presets(get_project_paths(self.window))
+        if len(self.presets) == 0:
+            sublime.error_message("Titanium: No build presets saved for the open projects")
+            return
+
+        options = [[name, os.path.basename(folder)] for folder, name, preset in self.presets]
+        self.window.show_quick_panel(options, self.select_preset)
+
+    def select_preset(self, select):
+        if select < 0:
+            return
+        folder, name, preset = self.presets[select]
+        self.window.run_command("titanium", {"preset": name, "project": folder})
+
+
+class TitaniumDeletePresetCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        self.presets = get_presets(get_project_paths(self.window))
+        if len(self.presets) == 0:
+            sublime.error_message("Titanium: No build presets saved for the open projects")
+            return
+
+        options = [[name, os.path.basename(folder)] for folder, name, preset in self.presets]
+        self.window.show_quick_panel(options, self.select_preset)
+
+    def select_preset(self, select):
+        if select < 0:
+            return
+        folder, name, preset = self.presets[select]
+        delete_project_preset(folder, name)
+        sublime.status_message("Titanium: deleted preset \"" + name + "\"")
+
+
+#---------------------------------------------------------------------------
+# BUILD TIMING
+# Each build records how long its phases took in a JSONL log, so that
+# changes in build latency can be measured
+#---------------------------------------------------------------------------
+
+TIMING_LOG = "timings.jsonl"
+
+#Order the phases are reported in
+TIMING_PHASES = ["credentials", "session", "panels", "sdk_version", "environment", "project_version", "signing_check", "dist_check", "waiting", "total", "first_output"]
+
+timingLock = threading.Lock()
+
+#Collects the timed spans of a single build. Spans with the same name are added together
+class BuildTimer(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = {}
+        self.running = {}
+
+    def start(self, name):
+        self.running[name] = time.time()
+
+    def stop(self, name):
+        started = self.running.pop(name, None)
+        if started is not None:
+            self.add(name, time.time() - started)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0) + seconds
+
+    #Times a background load from now until it finishes
+    def track(self, name, future):
+        started = time.time()
+        future.add_done_callback(lambda f: self.add(name, time.time() - started))
+
+def record_build_timing(project, platform, target, spans):
+    record = {
+        "time": time.time(),
+        "project": project,
+        "platform": platform,
+        "target": target,
+        "spans": dict((name, round(seconds, 3)) for name, seconds in spans.items())
+    }
+    with timingLock:
+        try:
+            with open(os.path.join(get_cache_folder(), TIMING_LOG), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except (IOError, OSError) as e:
+            print("Titanium: unable to write build timing: " + str(e))
+
+def read_build_timings(log=TIMING_LOG):
+    records = []
+    try:
+        with open(os.path.join(get_cache_folder(), log), "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except (IOError, OSError):
+        pass
+    return records
+
+#Nearest rank percentile of a sorted list
+def percentile(values, pct):
+    index = max(0, int(math.ceil(pct / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+def format_timing_stats(title, records):
+    phases = {}
+    for record in records:
+        for name, seconds in record["spans"].items():
+            phases.setdefault(name, []).append(seconds)
+
+    names = [name for name in TIMING_PHASES if name in phases] + sorted(name for name in phases if name not in TIMING_PHASES)
+    lines = [title + " (" + str(len(records)) + " builds)", "  %-16s %6s %8s %8s %8s %8s" % ("phase", "count", "p50", "p90", "p99", "max")]
+    for name in names:
+        values = sorted(phases[name])
+        lines.append("  %-16s %6d %7.2fs %7.2fs %7.2fs %7.2fs" % (name, len(values), percentile(values, 50), percentile(values, 90), percentile(values, 99), values[-1]))
+    return "\n".join(lines) + "\n\n"
+
+
+class TitaniumShowTimingStatsCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        records = read_build_timings()
+        if len(records) == 0:
+            sublime.status_message("Titanium: no build timings recorded yet")
+            return
+
+        text = format_timing_stats("All builds", records)
+        groups = {}
+        for record in records:
+            groups.setdefault(record["platform"] + " " + record["target"], []).append(record)
+        for name in sorted(groups):
+            text += format_timing_stats(name, groups[name])
+
+        view = self.window.new_file()
+        view.set_name("Titanium Build Timing Stats")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": text})
+        view.set_read_only(True)
+
+
+#---------------------------------------------------------------------------
+# BUILD PHASES
+# The CLI's own phases (Alloy, javac, gradle, xcodebuild, install, launch) are
+# timed from its output as it streams, and kept per project, platform and target
+# so that a phase that has become slower can be spotted
+#---------------------------------------------------------------------------
+
+PHASE_LOG = "phases.jsonl"
+
+#The phases of a build, in the order they run. A phase starts at the first line matching its pattern,
+#and runs until the next phase starts or a line matches "end"
+BUILD_PHASES = [
+    ("alloy", r"Executing Alloy compile|Alloy compiler"),
+    ("js", r"Processing JavaScript files|Minifying JavaScript|Encrypting JavaScript"),
+    ("javac_dex", r"Compiling Java source files|Building Java source files|Running dexer|Merging dex"),
+    ("gradle", r"Building with gradle|Running gradle|> Task :"),
+    ("xcodebuild", r"Invoking xcodebuild"),
+    ("install", r"Installing apk|Installing app|Installing the app|Installing application"),
+    ("launch", r"Starting app|Launching app|Launching the app|Launching application")
+]
+BUILD_PHASE_NAMES = [name for name, pattern in BUILD_PHASES]
+
+#"end" stops the running phase, and "complete" ends the build once the app is installed or running
+BUILD_PHASE_MARKERS = BUILD_PHASES + [
+    ("end", r"Alloy compiled in|Project built successfully|\*\* BUILD SUCCEEDED \*\*"),
+    ("complete", r"Start application log|Application started|App successfully installed|Application pid")
+]
+BUILD_PHASE_PATTERN = re.compile("|".join("(?P<%s>%s)" % (name, pattern) for name, pattern in BUILD_PHASE_MARKERS))
+
+#Searching for the markers without groups is much faster, and almost every line doesn't hold one
+BUILD_PHASE_FILTER = re.compile("|".join(pattern for name, pattern in BUILD_PHASE_MARKERS))
+
+#Number of earlier builds the median of a phase is taken over
+PHASE_MEDIAN_BUILDS = 10
+
+#A phase has regressed when it took PHASE_REGRESSION_RATIO times its median, and at least PHASE_REGRESSION_SECONDS longer
+PHASE_REGRESSION_RATIO = 1.25
+PHASE_REGRESSION_SECONDS = 5
+
+#Times the phases of a build from the lines of its output. Runs on the runner's output thread
+class BuildPhases(object):
+
+    def __init__(self):
+        self.current = None
+        self.currentStarted = None
+        self.durations = {}
+        self.complete = False
+        self.completed = None
+
+    def add(self, line, now):
+        if self.complete or BUILD_PHASE_FILTER.search(line) is None:
+            return
+        match = BUILD_PHASE_PATTERN.search(line)
+
+        phase = match.lastgroup
+        if phase == "end":
+            self.stop(now)
+        elif phase == "complete":
+            self.finish(now)
+            self.complete = True
+        elif phase not in self.durations and phase != self.current:
+            #Lines of an earlier phase (gradle's javac tasks, for example) don't start it again
+            if self.current is None or BUILD_PHASE_NAMES.index(phase) > BUILD_PHASE_NAMES.index(self.current):
+                self.stop(now)
+                self.current = phase
+                self.currentStarted = now
+
+    def stop(self, now):
+        if self.current is not None:
+            self.durations[self.current] = now - self.currentStarted
+            self.current = None
+
+    def finish(self, now):
+        if not self.complete:
+            self.stop(now)
+            self.completed = now
+
+def record_build_phases(project, platform, target, durations):
+    record = {
+        "time": time.time(),
+        "project": project,
+        "platform": platform,
+        "target": target,
+        "phases": dict((name, round(seconds, 3)) for name, seconds in durations.items())
+    }
+    with timingLock:
+        try:
+            with open(os.path.join(get_cache_folder(), PHASE_LOG), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except (IOError, OSError) as e:
+            print("Titanium: unable to write build phases: " + str(e))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+#Returns the phases of the group's latest build that regressed, as [phase, seconds, median],
+#comparing each phase with its median over the PHASE_MEDIAN_BUILDS builds before it
+def get_phase_regressions(records):
+    if len(records) < 2:
+        return []
+    latest = records[-1]["phases"]
+    earlier = records[-PHASE_MEDIAN_BUILDS - 1:-1]
+
+    regressions = []
+    for name in BUILD_PHASE_NAMES + ["total"]:
+        values = [record["phases"][name] for record in earlier if name in record["phases"]]
+        if name not in latest or len(values) == 0:
+            continue
+        typical = median(values)
+        if latest[name] >= typical * PHASE_REGRESSION_RATIO and latest[name] - typical >= PHASE_REGRESSION_SECONDS:
+            regressions.append([name, latest[name], typical])
+    return regressions
+
+def get_phase_groups(records):
+    groups = {}
+    for record in records:
+        groups.setdefault((record["project"], record["platform"], record["target"]), []).append(record)
+    return groups
+
+def format_phase_trends(title, records):
+    regressed = set(name for name, seconds, typical in get_phase_regressions(records))
+    recent = records[-PHASE_MEDIAN_BUILDS:]
+    names = [name for name in BUILD_PHASE_NAMES + ["total"] if any(name in record["phases"] for record in recent)]
+
+    lines = [title + " (" + str(len(records)) + " builds)", "  %-12s %8s %8s %7s  %s" % ("phase", "latest", "median", "change", "recent builds, oldest first")]
+    for name in names:
+        values = [record["phases"][name] for record in recent if name in record["phases"]]
+        latest = records[-1]["phases"].get(name)
+        earlier = [record["phases"][name] for record in records[-PHASE_MEDIAN_BUILDS - 1:-1] if name in record["phases"]]
+        typical = median(earlier) if len(earlier) > 0 else None
+
+        change = ""
+        if latest is not None and typical:
+            change = "%+d%%" % int(round((latest - typical) * 100.0 / typical))
+        line = "  %-12s %8s %8s %7s  %s" % (name,
+            "%.1fs" % latest if latest is not None else "-",
+            "%.1fs" % typical if typical is not None else "-",
+            change, " ".join("%.1f" % value for value in values))
+        if name in regressed:
+            line += "  << regressed"
+        lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+class TitaniumShowBuildTrendsCommand(sublime_plugin.WindowCommand):
+
+    #Shows the phase timings of each project, platform and target, with the phases whose latest build regressed flagged
+    def run(self):
+        records = read_build_timings(PHASE_LOG)
+        if len(records) == 0:
+            sublime.status_message("Titanium: no build phases recorded yet")
+            return
+
+        text = ""
+        groups = get_phase_groups(records)
+        for project, platform, target in sorted(groups):
+            text += format_phase_trends(os.path.basename(project) + " " + platform + " " + target, groups[(project, platform, target)])
+
+        view = self.window.new_file()
+        view.set_name("Titanium Build Trends")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": text})
+        view.set_read_only(True)
+
+
+#---------------------------------------------------------------------------
+# BUILD RUNNER
+# Runs the CLI without a shell and reads its output on a background thread.
+# The output panel is updated in batches and only keeps the most recent
+# lines. The full output is written to a log file
+#---------------------------------------------------------------------------
+
+#Milliseconds between two updates of the output panel
+OUTPUT_FLUSH_INTERVAL = 100
+
+#The most recent build of each output panel, keyed by window id and output panel name
+buildRunners = {}
+
+#Levels of the CLI's log output, from most to least verbose
+LOG_LEVELS = ["trace", "debug", "info", "warn", "error"]
+
+LOG_LEVEL_PATTERN = re.compile(r'^\[(TRACE|DEBUG|INFO|WARN|ERROR)\]')
+
+#References to source files, such as /path/to/app/controllers/index.js:12:5
+FILE_REFERENCE_PATTERN = re.compile(r'((?:/|[A-Za-z]:\\)[^\s:"\'()\[\]]+\.[A-Za-z]+):(\d+)(?::(\d+))?')
+
+#Number of lines after an error in which a file reference is taken to belong to the error
+ERROR_REFERENCE_LINES = 5
+
+#Seconds a cancelled build is given to exit before its processes are killed outright
+KILL_GRACE_PERIOD = 5
+
+#The build scheduler of each project, keyed by project folder
+buildSchedulers = {}
+
+def get_build_runner(window, panelName="titanium"):
+    return buildRunners.get((window.id(), panelName))
+
+#Every window has its own log file for each output panel, as the panels of different windows build at the same time
+def get_build_log_file(window, panelName):
+    folder = os.path.join(get_cache_folder(), "logs")
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    return os.path.join(folder, "%d-%s.log" % (window.id(), panelName))
+
+#Index of a build's log, built while the output streams in.
+#Holds the level of every line, and the errors along with the source file they reference
+class BuildLogIndex(object):
+
+    def __init__(self):
+        self.levels = bytearray()
+        self.level = LOG_LEVELS.index("info")
+        #Each problem is [line number, text, path, row, column]. Problems without a file reference have a path of None
+        self.problems = []
+
+    def __len__(self):
+        return len(self.levels)
+
+    #Indexes the next line of the log and returns its level.
+    #Lines without a level are continuations of the line before them
+    def add(self, line):
+        m = LOG_LEVEL_PATTERN.match(line)
+        if m is not None:
+            self.level = LOG_LEVELS.index(m.group(1).lower())
+        lineNumber = len(self.levels)
+        self.levels.append(self.level)
+
+        if m is not None and self.level == LOG_LEVELS.index("error"):
+            self.problems.append([lineNumber, line.strip(), None, 0, 0])
+
+        ref = FILE_REFERENCE_PATTERN.search(line) if "." in line else None
+        if ref is not None:
+            if len(self.problems) > 0:
+                problem = self.problems[-1]
+                if problem[2] is None and lineNumber - problem[0] <= ERROR_REFERENCE_LINES:
+                    problem[2] = ref.group(1)
+                    problem[3] = int(ref.group(2))
+                    problem[4] = int(ref.group(3) or 0)
+
+        return self.level
+
+
+class BuildRunner(object):
+
+    #level is the least severe log level shown in the output panel. Every level is written to the log file
+    def __init__(self, window, cmd, cwd=None, panelName="titanium", maxLines=5000, level="trace"):
+        self.window = window
+        self.cmd = cmd
+        self.cwd = cwd
+        self.panelName = panelName
+        self.maxLines = maxLines
+        self.logFile = get_build_log_file(window, panelName)
+
+        #Lines read since the last panel update. Lines that don't fit are only written to the log file
+        self.pending = collections.deque(maxlen=maxLines)
+        self.lock = threading.Lock()
+        self.panelLines = 0
+        self.process = None
+        self.started = None
+        self.firstOutput = None
+        self.exitCode = None
+        self.finished = False
+        self.killed = False
+        self.index = BuildLogIndex()
+        self.visibleLevel = LOG_LEVELS.index(level)
+        self.nextProblem = 0
+        self.log = None
+        self.footer = ""
+        self.phases = BuildPhases()
+        #"build" or "clean", along with the function called on the UI thread once the build has finished. Both are set by the scheduler
+        self.kind = "build"
+        self.onFinished = None
+
+    def start(self):
+        self.panel = self.window.create_output_panel(self.panelName)
+        settings = self.panel.settings()
+        settings.set("result_file_regex", FILE_REFERENCE_PATTERN.pattern)
+        settings.set("word_wrap", False)
+        settings.set("line_numbers", False)
+        settings.set("gutter", False)
+        settings.set("scroll_past_end", False)
+        self.window.run_command("show_panel", {"panel": "output." + self.panelName})
+
+        #Node, which the CLI runs on, is usually installed next to it
+        env = os.environ.copy()
+        env["PATH"] = os.path.dirname(self.cmd[0]) + os.pathsep + env.get("PATH", "")
+
+        self.started = time.time()
+        try:
+            self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                cwd=self.cwd, env=env, start_new_session=(os.name == "posix"))
+        except OSError as e:
+            self.panel.run_command("append", {"characters": "Unable to run " + self.cmd[0] + ": " + str(e) + "\n", "force": True})
+            self.finished = True
+            self.exitCode = -1
+            if self.onFinished is not None:
+                sublime.set_timeout(lambda: self.onFinished(self), 0)
+            return
+
+        thread = threading.Thread(target=self.read_output)
+        thread.daemon = True
+        thread.start()
+        sublime.set_timeout(self.flush, OUTPUT_FLUSH_INTERVAL)
+
+    def read_output(self):
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        with open(self.logFile, "wb") as log:
+            self.log = log
+            for data in iter(self.process.stdout.readline, b""):
+                #A killed build's panel and log file may already be used by the build that replaced it
+                if self.killed:
+                    continue
+                line = decoder.decode(data).replace("\r\n", "\n")
+                now = time.time()
+                with self.lock:
+                    log.write(data)
+                    if self.firstOutput is None:
+                        self.firstOutput = now
+                    if self.index.add(line) >= self.visibleLevel:
+                        self.pending.append(line)
+                self.phases.add(line, now)
+            with self.lock:
+                self.log = None
+
+        self.process.stdout.close()
+        self.exitCode = self.process.wait()
+        self.phases.finish(time.time())
+        with self.lock:
+            self.finished = True
+
+    #Runs on the UI thread. Appends the pending lines to the panel, then trims the panel to maxLines
+    def flush(self):
+        with self.lock:
+            lines = list(self.pending)
+            self.pending.clear()
+            finished = self.finished
+
+        if self.killed:
+            lines = []
+
+        if len(lines) > 0:
+            self.panel.run_command("append", {"characters": "".join(lines), "force": True, "scroll_to_end": True})
+            self.panelLines += len(lines)
+            if self.panelLines > self.maxLines:
+                self.panel.run_command("titanium_trim_panel", {"lines": self.panelLines - self.maxLines})
+                self.panelLines = self.maxLines
+
+        if not finished:
+            sublime.set_timeout(self.flush, OUTPUT_FLUSH_INTERVAL)
+            return
+
+        if self.onFinished is not None:
+            self.onFinished(self)
+
+        elapsed = time.time() - self.started
+        if self.killed:
+            message = "[Cancelled]"
+            if buildRunners.get((self.window.id(), self.panelName)) is not self:
+                return
+        elif self.exitCode == 0:
+            message = "[Finished in %.1fs]" % elapsed
+        else:
+            message = "[Finished in %.1fs with exit code %d]" % (elapsed, self.exitCode)
+        self.footer = message + "\nFull log: " + self.logFile + "\n"
+        self.panel.run_command("append", {"characters": self.footer, "force": True, "scroll_to_end": True})
+
+
+    #Shows the lines of the given level and above in the output panel, using the log file and its index.
+    #A build that hasn't started yet (it waits for the build it replaced to exit) shows the level once it starts
+    def show_level(self, level):
+        with self.lock:
+            self.visibleLevel = LOG_LEVELS.index(level)
+            if self.started is None:
+                sublime.status_message("Titanium: the build will show " + level + " output once it starts")
+                return
+            self.pending.clear()
+            count = len(self.index)
+            levels = self.index.levels[:count]
+            if self.log is not None:
+                self.log.flush()
+
+        lines = []
+        try:
+            with open(self.logFile, "rb") as log:
+                for lineNumber, data in enumerate(log):
+                    if lineNumber >= count:
+                        break
+                    if levels[lineNumber] >= self.visibleLevel:
+                        lines.append(data)
+        except (IOError, OSError):
+            #The build has only just started, and hasn't created its log file yet
+            pass
+        lines = lines[-self.maxLines:]
+
+        self.panel.run_command("titanium_trim_panel", {"lines": -1})
+        text = b"".join(lines).decode("utf-8", "replace").replace("\r\n", "\n")
+        self.panel.run_command("append", {"characters": text + self.footer, "force": True, "scroll_to_end": True})
+        self.panelLines = len(lines)
+        self.window.run_command("show_panel", {"panel": "output." + self.panelName})
+
+    #Returns the next error in the log, as [line number, text, path, row, column], starting over after the last one
+    def next_problem(self):
+        with self.lock:
+            problems = list(self.index.problems)
+        if len(problems) == 0:
+            return None
+        problem = problems[self.nextProblem % len(problems)]
+        self.nextProblem += 1
+        return problem
+
+    def is_same_panel(self, other):
+        return self.window.id() == other.window.id() and self.panelName == other.panelName
+
+    #Kills the CLI along with the processes it started (node, gradle, xcodebuild...).
+    #They are asked to exit first, and killed outright if they haven't after KILL_GRACE_PERIOD seconds
+    def kill(self):
+        if self.finished:
+            return
+        self.killed = True
+        if self.process is None:
+            #Never started
+            self.finished = True
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(self.process.pid, signal.SIGTERM)
+                timer = threading.Timer(KILL_GRACE_PERIOD, self.force_kill)
+                timer.daemon = True
+                timer.start()
+            else:
+                subprocess.call(["taskkill", "/T", "/F", "/PID", str(self.process.pid)])
+        except OSError:
+            pass
+
+    def force_kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def get_build_scheduler(project):
+    scheduler = buildSchedulers.get(project)
+    if scheduler is None:
+        scheduler = BuildScheduler(project)
+        buildSchedulers[project] = scheduler
+    return scheduler
+
+#Shows the builds that are running and queued in the status bar of every view
+def show_build_status():
+    projects = []
+    for project, scheduler in sorted(buildSchedulers.items(), key=lambda item: item[0] or ""):
+        status = scheduler.get_status()
+        if status != "":
+            projects.append(os.path.basename(project or "") + ": " + status)
+    text = "Titanium " + ", ".join(projects) if len(projects) > 0 else ""
+
+    for window in sublime.windows():
+        for view in window.views():
+            if text == "":
+                view.erase_status("titanium_builds")
+            else:
+                view.set_status("titanium_builds", text)
+
+#Runs the builds and cleans of a project. A build replaces the build running (or queued) in the same output panel of the window,
+#identical requests are only run once, and a clean never runs at the same time as another build or clean of the project
+class BuildScheduler(object):
+
+    def __init__(self, project):
+        self.project = project
+        self.running = []
+        self.queue = []
+
+    #Runs the build once the builds it has to wait for have finished.
+    #Returns the runner that will show the output, which is an identical runner when one is still building.
+    #A build whose app is already running (the CLI keeps showing its log) is replaced, so that it is built again.
+    #The output panel is shared by every project in the window, so the builds of other projects in it are replaced too
+    def submit(self, runner):
+        schedulers = list(buildSchedulers.values())
+        for scheduler in schedulers:
+            for other in scheduler.running + scheduler.queue:
+                if other.is_same_panel(runner) and other.cmd == runner.cmd and other.kind == runner.kind and not other.killed and not other.phases.complete:
+                    return other
+
+        for scheduler in schedulers:
+            scheduler.cancel_panel(runner)
+
+        runner.onFinished = self.build_finished
+        buildRunners[(runner.window.id(), runner.panelName)] = runner
+        self.queue.append(runner)
+        self.start_next()
+        return runner
+
+    #Cancels the running and queued builds that show their output in the runner's panel
+    def cancel_panel(self, runner):
+        for other in list(self.queue):
+            if other.is_same_panel(runner):
+                self.queue.remove(other)
+                other.kill()
+        for other in self.running:
+            if other.is_same_panel(runner):
+                other.kill()
+
+    #Starts the queued builds that can run, in the order they were queued.
+    #A build waits for the cancelled build of its output panel to exit, whichever project it was for, and for a running clean
+    def start_next(self):
+        blocked = False
+        for runner in list(self.queue):
+            samePanel = any(other.is_same_panel(runner) for scheduler in buildSchedulers.values() for other in scheduler.running)
+            if runner.kind == "clean":
+                if blocked or samePanel or len(self.running) > 0:
+                    break
+            elif samePanel or any(other.kind == "clean" for other in self.running):
+                blocked = True
+                continue
+            self.queue.remove(runner)
+            self.running.append(runner)
+            runner.start()
+        show_build_status()
+
+    #A finished build can unblock the builds of any project that were waiting for its output panel
+    def build_finished(self, runner):
+        if runner in self.running:
+            self.running.remove(runner)
+        for scheduler in list(buildSchedulers.values()):
+            scheduler.start_next()
+
+    def get_status(self):
+        running = [runner for runner in self.running if not runner.killed]
+        if len(running) == 0 and len(self.queue) == 0:
+            return ""
+        if any(runner.kind == "clean" for runner in running):
+            status = "cleaning"
+        elif len(running) > 1:
+            status = str(len(running)) + " builds running"
+        elif len(running) == 1:
+            status = "building"
+        else:
+            status = "waiting"
+        if len(self.queue) > 0:
+            status += ", " + str(len(self.queue)) + " queued"
+        return status
+
+
+class TitaniumTrimPanelCommand(sublime_plugin.TextCommand):
+
+    #Removes the given number of lines from the start of the view, or all of them when lines is -1
+    def run(self, edit, lines):
+        end = self.view.size() if lines < 0 else self.view.text_point(lines, 0)
+        self.view.erase(edit, sublime.Region(0, end))
+
+
+class TitaniumExecCommand(sublime_plugin.WindowCommand):
+
+    #Runs a CLI command, showing its output in an output panel. kind is "build" or "clean".
+    #The command is scheduled along with the other builds of the project in cwd
+    def run(self, cmd, cwd=None, panel="titanium", level="trace", kind="build"):
+        settings = sublime.load_settings('Titanium.sublime-settings')
+        runner = BuildRunner(self.window, cmd, cwd, panel, settings.get("outputPanelMaxLines", 5000), level)
+        runner.kind = kind
+        if get_build_scheduler(cwd).submit(runner) is not runner:
+            sublime.status_message("Titanium: the same build is already running")
+            self.window.run_command("show_panel", {"panel": "output." + panel})
+
+
+class TitaniumShowLogLevelCommand(sublime_plugin.WindowCommand):
+
+    #Changes the log level shown in the output of the most recent build, without building again
+    def run(self, level=None, panel="titanium"):
+        self.runner = get_build_runner(self.window, panel)
+        if self.runner is None:
+            sublime.status_message("Titanium: no build output to filter")
+            return
+
+        if level is not None:
+            self.runner.show_level(level)
+        else:
+            options = [[level, str(self.runner.index.levels.count(LOG_LEVELS.index(level))) + " lines"] for level in LOG_LEVELS]
+            self.window.show_quick_panel(options, self.select_level, 0, self.runner.visibleLevel)
+
+    def select_level(self, select):
+        if select < 0:
+            return
+        self.runner.show_level(LOG_LEVELS[select])
+
+
+class TitaniumNextErrorCommand(sublime_plugin.WindowCommand):
+
+    #Opens the source file referenced by the next error in the most recent build's log
+    def run(self, panel="titanium"):
+        runner = get_build_runner(self.window, panel)
+        problem = runner.next_problem() if runner is not None else None
+        if problem is None:
+            sublime.status_message("Titanium: no build errors")
+            return
+
+        lineNumber, text, path, row, column = problem
+        sublime.status_message(text)
+        if path is not None and os.path.isfile(path):
+            self.window.open_file(path + ":" + str(row) + ":" + str(column), sublime.ENCODED_POSITION)
+
+
+#---------------------------------------------------------------------------
+# BUILD MATRIX
+# Runs several presets at the same time, each in its own output panel,
+# with at most maxParallelBuilds builds running at once
+#---------------------------------------------------------------------------
+
+#Seconds between two checks of the matrix builds
+MATRIX_CHECK_INTERVAL = 0.5
+
+#A saved build matrix is a list of [project folder, preset name]
+def get_build_matrices(folders):
+    matrices = sublime.load_settings(PRESETS_FILE).get("matrices", {})
+    return dict((name, builds) for name, builds in matrices.items() if all(folder in folders for folder, preset in builds))
+
+def save_build_matrix(name, builds):
+    settings = sublime.load_settings(PRESETS_FILE)
+    matrices = settings.get("matrices", {})
+    matrices[name] = builds
+    settings.set("matrices", matrices)
+    sublime.save_settings(PRESETS_FILE)
+
+#Default preset names are the same in every project, so the panel is named after the project as well
+def get_matrix_panel_name(folder, presetName):
+    name = os.path.basename(os.path.normpath(folder)) + " " + presetName
+    return "titanium-" + re.sub(r'[^a-z0-9]+', '-', name.lower()).strip("-")
+
+class BuildMatrix(object):
+
+    #builds is a list of [project folder, preset name]
+    def __init__(self, window, builds, maxParallel, username, password, keystorePassword):
+        self.window = window
+        self.queue = list(builds)
+        self.maxParallel = max(1, maxParallel)
+        self.username = username
+        self.password = password
+        self.keystorePassword = keystorePassword
+        self.running = []
+        self.succeeded = []
+        self.failed = []
+
+    def start(self):
+        self.start_next()
+        self.check()
+
+    #Starts queued builds while there are free slots. Builds of the same project and platform write to the same
+    #build folder, so a build waits until the running build of its project and platform is done
+    def start_next(self):
+        for build in list(self.queue):
+            if len(self.running) >= self.maxParallel:
+                break
+            folder, name = build
+            target = (folder, get_project_presets(folder).get(name, {}).get("platform"))
+            if any(target == other for runningName, other, command in self.running):
+                continue
+
+            self.queue.remove(build)
+            command = TitaniumCommand(self.window)
+            command.run(preset=name, project=folder, panel=get_matrix_panel_name(folder, name),
+                username=self.username, password=self.password, keystorePassword=self.keystorePassword)
+            self.running.append((name, target, command))
+
+    #Moves the builds that have finished out of running, then starts queued builds in their place
+    def check(self):
+        for build in list(self.running):
+            name, target, command = build
+            if command.failed:
+                self.failed.append(name)
+            elif command.reused:
+                self.succeeded.append(name)
+            elif command.runner is not None and (command.runner.finished or command.runner.phases.complete):
+                #Builds that run the app keep the CLI running to show its log, so they are done once the app has started
+                if command.runner.phases.complete or command.runner.exitCode == 0:
+                    self.succeeded.append(name)
+                else:
+                    self.failed.append(name)
+            else:
+                continue
+            self.running.remove(build)
+
+        self.start_next()
+
+        if len(self.running) == 0:
+            message = "Titanium build matrix finished: " + str(len(self.succeeded)) + " succeeded"
+            if len(self.failed) > 0:
+                message += ", " + str(len(self.failed)) + " failed (" + ", ".join(self.failed) + ")"
+            sublime.status_message(message)
+            return
+
+        sublime.status_message("Titanium build matrix: " + str(len(self.running)) + " running, " + str(len(self.queue)) + " queued, " + str(len(self.succeeded) + len(self.failed)) + " done")
+        sublime.set_timeout(self.check, int(MATRIX_CHECK_INTERVAL * 1000))
+
+
+class TitaniumBuildMatrixCommand(sublime_plugin.WindowCommand):
+
+    #Runs several presets at once. The builds are either a saved matrix, a list of [project folder, preset name],
+    #or picked from the presets of the window's projects
+    def run(self, matrix=None, builds=None):
+        settings = sublime.load_settings('Titanium.sublime-settings')
+        self.maxParallel = settings.get("maxParallelBuilds", 2)
+        self.username = settings.get("appceleratorUsername", "")
+        self.password = settings.get("appceleratorPassword", "")
+        self.keystorePassword = None
+        self.selected = []
+        self.presets = get_presets(get_project_paths(self.window))
+        self.matrices = get_build_matrices(get_project_paths(self.window))
+
+        if matrix is not None:
+            if matrix not in self.matrices:
+                sublime.error_message("Titanium: No build matrix named \"" + matrix + "\"")
+                return
+            self.selected = self.matrices[matrix]
+            self.start_builds()
+        elif builds is not None:
+            self.selected = builds
+            self.start_builds()
+        elif len(self.presets) == 0:
+            sublime.error_message("Titanium: No build presets saved for the open projects")
+        else:
+            self.pick_builds()
+
+    #Shows the saved matrices and the presets. Picking a preset adds it to (or removes it from) the selection
+    def pick_builds(self):
+        self.matrixNames = sorted(self.matrices)
+        options = []
+        if len(self.selected) > 0:
+            options.append(["Run " + str(len(self.selected)) + " selected builds", ", ".join(name for folder, name in self.selected)])
+            options.append(["Save selection as a build matrix", ""])
+        for name in self.matrixNames:
+            options.append(["Matrix: " + name, ", ".join(preset for folder, preset in self.matrices[name])])
+        for folder, name, preset in self.presets:
+            mark = "[x] " if [folder, name] in self.selected else "[ ] "
+            options.append([mark + name, os.path.basename(folder)])
+
+        sublime.set_timeout(lambda: self.window.show_quick_panel(options, self.select_build), 10)
+
+    def select_build(self, select):
+        if select < 0:
+            return
+
+        if len(self.selected) > 0:
+            if select == 0:
+                self.start_builds()
+                return
+            if select == 1:
+                self.window.show_input_panel("Build Matrix Name", "", self.save_matrix, None, None)
+                return
+            select -= 2
+
+        if select < len(self.matrixNames):
+            self.selected = self.matrices[self.matrixNames[select]]
+            self.start_builds()
+            return
+        select -= len(self.matrixNames)
+
+        folder, name, preset = self.presets[select]
+        if [folder, name] in self.selected:
+            self.selected.remove([folder, name])
+        else:
+            self.selected.append([folder, name])
+        self.pick_builds()
+
+    def save_matrix(self, name):
+        if name == "":
+            return
+        save_build_matrix(name, self.selected)
+        sublime.status_message("Titanium: saved build matrix \"" + name + "\"")
+
+    #Prompts once for what the builds need, then starts them
+    def start_builds(self):
+        if self.username == "":
+            self.window.show_input_panel("Appcelerator Username", "", self.set_username, None, None)
+            return
+        if self.password == "":
+            self.window.show_input_panel("Appcelerator Password", "", self.set_password, None, None)
+            return
+
+        needsKeystore = False
+        for folder, name in self.selected:
+            preset = get_project_presets(folder).get(name, {})
+            if preset.get("target") == "dist-playstore":
+                needsKeystore = True
+        if needsKeystore and self.keystorePassword is None:
+            self.window.show_input_panel("Keystore password", "", self.set_keystore_password, None, None)
+            return
+
+        BuildMatrix(self.window, self.selected, self.maxParallel, self.username, self.password, self.keystorePassword).start()
+
+    def set_username(self, value):
+        if value == "":
+            return
+        self.username = value
+        self.start_builds()
+
+    def set_password(self, value):
+        if value == "":
+            return
+        self.password = value
+        self.start_builds()
+
+    def set_keystore_password(self, value):
+        if value == "":
+            return
+        self.keystorePassword = value
+        self.start_builds()
+
+
+#---------------------------------------------------------------------------
+# WATCH MODE
+# Builds a project again when a save changes the content of a file that goes into the app
+#---------------------------------------------------------------------------
+
+#Preset name that stands for the project's most recent build
+MOST_RECENT_BUILD = "most recent configuration"
+
+#Watched projects, keyed by project folder
+watchedProjects = {}
+
+#The files of a project that go into the app. Alloy generates Resources from app, so only app is watched in Alloy projects
+def get_watch_paths(folder):
+    if os.path.isdir(os.path.join(folder, "app")):
+        return ["app", "tiapp.xml"]
+    return ["Resources", "tiapp.xml"]
+
+def is_watched_file(folder, path):
+    relative = os.path.relpath(path, folder)
+    return any(relative == name or relative.startswith(name + os.sep) for name in get_watch_paths(folder))
+
+#The file hashes of a project are cached per kind of manifest ("watch" or "dist")
+def get_manifest_file(folder, kind="watch"):
+    return os.path.join(get_cache_folder(), kind + "-" + hashlib.sha1(folder.encode("utf-8")).hexdigest() + ".json")
+
+def read_manifest(folder, kind="watch"):
+    try:
+        with open(get_manifest_file(folder, kind), "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def write_manifest(folder, manifest, kind="watch"):
+    path = get_manifest_file(folder, kind)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        print("Titanium: unable to write " + kind + " manifest: " + str(e))
+
+def hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+#Returns the manifest of the project's watched files (or of the given files and folders), as {relative path: [mtime, size, sha1]}.
+#Only the files whose mtime or size differ from the previous manifest are hashed
+def scan_manifest(folder, previous, names=None):
+    paths = []
+    for name in (names if names is not None else get_watch_paths(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            paths.append(path)
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            paths.extend(os.path.join(root, f) for f in files if not f.startswith("."))
+
+    manifest = {}
+    for path in paths:
+        relative = os.path.relpath(path, folder)
+        try:
+            stat = os.stat(path)
+            entry = previous.get(relative)
+            if entry is None or entry[0] != stat.st_mtime or entry[1] != stat.st_size:
+                entry = [stat.st_mtime, stat.st_size, hash_file(path)]
+        except (IOError, OSError):
+            continue
+        manifest[relative] = entry
+    return manifest
+
+#Returns the files that were added, removed or whose content changed
+def get_manifest_changes(old, new):
+    changes = [path for path, entry in new.items() if path not in old or old[path][2] != entry[2]]
+    changes.extend(path for path in old if path not in new)
+    return sorted(changes)
+
+class ProjectWatch(object):
+
+    def __init__(self, window, folder, preset, username, password, debounce):
+        self.window = window
+        self.folder = folder
+        self.preset = preset
+        self.username = username
+        self.password = password
+        self.debounce = debounce
+        self.manifest = None
+        self.lock = threading.Lock()
+        self.saves = 0
+
+    #Hashes the files in the background, reusing the hashes of the previous watch of the project.
+    #It doesn't wait behind the prewarming, so that the files are hashed before they are saved
+    def start(self):
+        workerPool.submit(self.check, True)
+
+    #Returns the files that changed since the last build, along with the new manifest.
+    #The new manifest is only kept once a build of the changes has started, in build_requested.
+    #The baseline check keeps the files as they are when the watch starts. A save checked before it
+    #compares the files with the manifest of the previous watch instead
+    def check(self, baseline=False):
+        with self.lock:
+            previous = self.manifest if self.manifest is not None else read_manifest(self.folder)
+            manifest = scan_manifest(self.folder, previous)
+            if not baseline:
+                return get_manifest_changes(previous, manifest), manifest
+
+            if self.manifest is None:
+                self.manifest = manifest
+                write_manifest(self.folder, manifest)
+            return [], manifest
+
+    #Checks for changes once no file has been saved for debounce seconds, so that a "save all" builds once
+    def saved(self, path):
+        if not is_watched_file(self.folder, path):
+            return
+        self.saves += 1
+        saves = self.saves
+        sublime.set_timeout(lambda: self.settled(saves), int(self.debounce * 1000))
+
+    def settled(self, saves):
+        if saves != self.saves or watchedProjects.get(self.folder) is not self:
+            return
+        future = workerPool.submit(self.check)
+        future.add_done_callback(lambda f: sublime.set_timeout(lambda: self.checked(f), 0))
+
+    def checked(self, future):
+        if watchedProjects.get(self.folder) is not self:
+            return
+        try:
+            changes, manifest = future.result()
+        except Exception as e:
+            print("Titanium: unable to check for changes: " + str(e))
+            return
+
+        if len(changes) == 0:
+            sublime.status_message("Titanium: nothing to build, no files changed")
+            return
+        sublime.status_message("Titanium: " + str(len(changes)) + " changed file(s), building " + os.path.basename(self.folder))
+        previous = get_build_runner(self.window)
+        command = TitaniumCommand(self.window)
+        command.run(preset=self.preset, project=self.folder, username=self.username, password=self.password)
+        self.build_requested(command, previous, manifest)
+
+    #Keeps the manifest once the build of the changes has started. When the same build was still building,
+    #it may have missed the changes, so they are checked again once it is done
+    def build_requested(self, command, previous, manifest):
+        if watchedProjects.get(self.folder) is not self or command.failed:
+            return
+        if command.runner is None and not command.reused:
+            sublime.set_timeout(lambda: self.build_requested(command, previous, manifest), 100)
+            return
+
+        if command.reused or command.runner is not previous:
+            with self.lock:
+                self.manifest = manifest
+                write_manifest(self.folder, manifest)
+        elif not previous.finished and not previous.phases.complete:
+            sublime.set_timeout(lambda: self.build_requested(command, previous, manifest), 500)
+        else:
+            self.settled(self.saves)
+
+
+class TitaniumWatchCommand(sublime_plugin.WindowCommand):
+
+    #Turns building on save on or off for the active project. The builds use the given preset, or the project's most recent build,
+    #so no dialogs are shown. The preset is looked up once, so builds of other projects don't change what is built
+    def run(self, preset=None):
+        folder = self.get_project()
+        if folder is None:
+            sublime.error_message("Titanium: Open a file of a Titanium project to watch it")
+            return
+
+        if folder in watchedProjects:
+            del watchedProjects[folder]
+            sublime.status_message("Titanium: stopped watching " + os.path.basename(folder))
+            return
+
+        if preset is None or preset == MOST_RECENT_BUILD:
+            preset = get_most_recent_build([folder])
+            if preset is None:
+                sublime.error_message("Titanium: Build " + os.path.basename(folder) + " once, so watch mode knows what to build")
+                return
+        else:
+            name = preset
+            preset = get_project_presets(folder).get(name)
+            if preset is None:
+                sublime.error_message("Titanium: No build preset named \"" + name + "\" in " + os.path.basename(folder))
+                return
+
+        settings = sublime.load_settings('Titanium.sublime-settings')
+        self.folder = folder
+        self.preset = preset
+        self.debounce = settings.get("watchDebounce", 1.0)
+        self.username = settings.get("appceleratorUsername", "")
+        self.password = settings.get("appceleratorPassword", "")
+        self.start_watch()
+
+    #The project of the active file, or of the most recent build
+    def get_project(self):
+        view = self.window.active_view()
+        if view is not None and get_view_project(view) is not None:
+            return get_view_project(view)
+        mostRecent = get_most_recent_build(get_project_paths(self.window))
+        if mostRecent is not None:
+            return mostRecent["project"]
+        projects, pending = get_window_projects(self.window)
+        if len(projects) > 0:
+            return projects[0].path
+        return None
+
+    #Prompts once for the credentials the builds need
+    def start_watch(self):
+        if self.username == "":
+            self.window.show_input_panel("Appcelerator Username", "", self.set_username, None, None)
+            return
+        if self.password == "":
+            self.window.show_input_panel("Appcelerator Password", "", self.set_password, None, None)
+            return
+
+        watch = ProjectWatch(self.window, self.folder, self.preset, self.username, self.password, self.debounce)
+        watchedProjects[self.folder] = watch
+        watch.start()
+        sublime.status_message("Titanium: building " + os.path.basename(self.folder) + " on save")
+
+    def set_username(self, value):
+        if value == "":
+            return
+        self.username = value
+        self.start_watch()
+
+    def set_password(self, value):
+        if value == "":
+            return
+        self.password = value
+        self.start_watch()
+
+
+class TitaniumWatchListener(sublime_plugin.EventListener):
+
+    def on_post_save_async(self, view):
+        path = view.file_name()
+        project = find_project_folder(path) if path is not None else None
+        watch = watchedProjects.get(project)
+        if watch is not None:
+            sublime.set_timeout(lambda: watch.saved(path), 0)
+
+
+class TitaniumRefreshEnvironmentCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        settings = sublime.load_settings('Titanium.sublime-settings')
+        appc = settings.get("appceleratorPath", "/usr/local/bin/appc")
+        user = settings.get("appceleratorUsername", "")
+        password = settings.get("appceleratorPassword", "")
+        ttl = settings.get("environmentCacheTTL", 86400)
+
+        clear_environment_cache()
+
+        #Without stored credentials the environment will be reloaded during the next build
+        if user == "" or password == "":
+            sublime.status_message("Titanium environment cache cleared")
+            return
+
+        sublime.status_message("Refreshing Titanium environment...")
+        futures = [load_environment_info(appc, user, password, ttl, platform) for platform in ENVIRONMENT_PLATFORMS]
+
+        def refreshed(future):
+            if all(f.done() for f in futures):
+                sublime.status_message("Titanium environment refreshed")
+
+        for future in futures:
+            future.add_done_callback(refreshed)
+
+
+#---------------------------------------------------------------------------
+# DIST CACHE
+# Distribution builds write a manifest next to their artifacts in dist/<version>,
+# describing the sources, SDK and signing identity they were built from. A build
+# with the same manifest reuses the artifacts instead of building them again.
+# Every platform and target has its own manifest, as they share the folder
+#---------------------------------------------------------------------------
+
+DIST_MANIFEST_FILE = "titanium-build-%s-%s.json"
+
+#Matches the manifests of all platforms and targets, and their temporary files
+DIST_MANIFEST_PATTERN = re.compile(r'^titanium-build-[\w-]+\.json(?:\.tmp)?$')
+
+#Folders that go into a distribution build, along with the watched files
+DIST_SOURCE_PATHS = ["i18n", "platform", "modules", "plugins"]
+
+#Two distribution builds of a project (android and ios in a build matrix) share its cached file hashes
+distLock = threading.Lock()
+
+#Returns a hash of the project's sources. Only the files that changed since the previous distribution build are hashed again
+def get_source_hash(folder):
+    with distLock:
+        manifest = scan_manifest(folder, read_manifest(folder, "dist"), get_watch_paths(folder) + DIST_SOURCE_PATHS)
+        write_manifest(folder, manifest, "dist")
+
+    sha1 = hashlib.sha1()
+    for path in sorted(manifest):
+        sha1.update((path + "\0" + manifest[path][2] + "\n").encode("utf-8"))
+    return sha1.hexdigest()
+
+#Returns what a distribution build of the preset is built from. The keystore password is never part of it
+def get_dist_key(folder, sdk, preset):
+    key = {
+        "source": get_source_hash(folder),
+        "tiapp": hash_file(os.path.join(folder, "tiapp.xml")),
+        "sdk": sdk,
+        "platform": preset["platform"],
+        "target": preset["target"]
+    }
+    if preset["platform"] == "android":
+        keystore = os.path.expanduser(preset["androidKeystore"])
+        key["keystore"] = hash_file(keystore) if os.path.isfile(keystore) else preset["androidKeystore"]
+        key["keyAlias"] = preset["keyAlias"]
+    else:
+        key["family"] = preset["family"]
+        key["iosCert"] = preset["iosCert"]
+        key["iosProvisioningProfile"] = preset["iosProvisioningProfile"]
+    return key
+
+def get_dist_manifest_file(outputFolder, key):
+    return os.path.join(outputFolder, DIST_MANIFEST_FILE % (key["platform"], key["target"]))
+
+#Returns the files in the output folder, as {name: [size, mtime]}
+def get_dist_artifacts(outputFolder):
+    artifacts = {}
+    try:
+        names = os.listdir(outputFolder)
+    except OSError:
+        return artifacts
+    for name in names:
+        path = os.path.join(outputFolder, name)
+        if not DIST_MANIFEST_PATTERN.match(name) and not name.startswith(".") and os.path.isfile(path):
+            artifacts[name] = [os.path.getsize(path), os.path.getmtime(path)]
+    return artifacts
+
+def read_dist_manifest(outputFolder, key):
+    try:
+        with open(get_dist_manifest_file(outputFolder, key), "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+#Returns the names of the artifacts of an identical build in the output folder,
+#or None when the folder has to be built again
+def find_dist_build(outputFolder, key):
+    manifest = read_dist_manifest(outputFolder, key)
+    if manifest is None or manifest.get("key") != key or len(manifest.get("artifacts", {})) == 0:
+        return None
+
+    artifacts = get_dist_artifacts(outputFolder)
+    for name, stat in manifest["artifacts"].items():
+        if artifacts.get(name) != stat:
+            return None
+    return sorted(manifest["artifacts"])
+
+#Records the artifacts of a successful build: the files it created or changed since `before`,
+#so the artifacts of the other platforms in the folder are not taken for its own. Builds that produced no artifacts are not reused
+def write_dist_manifest(outputFolder, key, before):
+    artifacts = dict((name, stat) for name, stat in get_dist_artifacts(outputFolder).items() if before.get(name) != stat)
+    if len(artifacts) == 0:
+        return
+
+    path = get_dist_manifest_file(outputFolder, key)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key": key, "artifacts": artifacts, "built": time.time()}, f, indent=4)
+        os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        print("Titanium: unable to write dist manifest: " + str(e))
+
+#Removes the manifest before building, so the artifacts of a build that fails are never reused
+def remove_dist_manifest(outputFolder, key):
+    try:
+        os.remove(get_dist_manifest_file(outputFolder, key))
+    except OSError:
+        pass
+
+
+#---------------------------------------------------------------------------
+# DEVICE TRACKER
+# Keeps the connected devices up to date in the background, so devices plugged in
+# (and emulators started) after `ti info` ran can be picked without loading it again.
+# Android devices are streamed from `adb track-devices`, iOS devices are polled
+#---------------------------------------------------------------------------
+
+#Seconds between two checks for connected iOS devices, and before adb is started again after it has exited
+DEVICE_POLL_INTERVAL = 5
+
+#The tracker of the connected devices, started the first time a build needs devices
+deviceTracker = None
+
+#Returns the adb to track devices with: the adbPath setting, the adb of the androidSDK setting, or the adb on the PATH
+def find_adb(settings):
+    path = settings.get("adbPath", "")
+    if path != "":
+        return os.path.expanduser(path)
+    sdk = settings.get("androidSDK", "")
+    if sdk != "":
+        path = os.path.join(os.path.expanduser(sdk), "platform-tools", "adb")
+        if os.path.isfile(path):
+            return path
+    return shutil.which("adb")
+
+#Parses a device list sent by `adb track-devices -l`, which holds a "serial state key:value ..." line per device.
+#Returns {serial: {"state": state, key: value}}
+def parse_adb_devices(text):
+    devices = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        device = {"state": fields[1]}
+        for field in fields[2:]:
+            key, separator, value = field.partition(":")
+            if separator != "":
+                device[key] = value
+        devices[fields[0]] = device
+    return devices
+
+def set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+class DeviceTracker(object):
+
+    #adb is None when Android devices aren't tracked. androidReady and iosReady are done once the first device list
+    #has been read (or couldn't be). androidLive and iosLive tell whether the device lists are up to date
+    def __init__(self, adb, trackIos):
+        self.adb = adb
+        self.trackIos = trackIos
+        self.lock = threading.Lock()
+        self.androidDevices = {}
+        self.emulatorNames = {}
+        self.iosDevices = {}
+        self.androidLive = False
+        self.iosLive = False
+        self.androidReady = Future()
+        self.iosReady = Future()
+        self.process = None
+        self.stopped = False
+
+    def start(self):
+        if self.adb is not None:
+            threading.Thread(target=self.track_android, daemon=True).start()
+        else:
+            set_future_result(self.androidReady, False)
+
+        idevice = shutil.which("idevice_id") if self.trackIos else None
+        if idevice is not None:
+            threading.Thread(target=self.poll_ios, args=(idevice,), daemon=True).start()
+        else:
+            set_future_result(self.iosReady, False)
+
+    def stop(self):
+        self.stopped = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    #adb sends the full device list each time a device connects, disconnects or changes state.
+    #adb exits when its server is killed, so it is started again until the tracker is stopped
+    def track_android(self):
+        while not self.stopped:
+            try:
+                self.process = open_cli([self.adb, "track-devices", "-l"], True, subprocess.DEVNULL)
+            except OSError as e:
+                print("Titanium: unable to track Android devices: " + str(e))
+                break
+            self.read_android_devices(self.process.stdout)
+            self.process.wait()
+
+            with self.lock:
+                self.androidDevices = {}
+                self.androidLive = False
+            set_future_result(self.androidReady, False)
+            time.sleep(DEVICE_POLL_INTERVAL)
+        set_future_result(self.androidReady, False)
+
+    #Each device list is sent as its length in 4 hex digits, followed by the list
+    def read_android_devices(self, stream):
+        while True:
+            header = stream.read(4)
+            if len(header) < 4:
+                return
+            try:
+                length = int(header, 16)
+            except ValueError:
+                return
+            devices = parse_adb_devices(stream.read(length).decode("utf-8", "replace"))
+
+            #Builds are run on emulators by AVD name, which adb only gives through the emulator's console
+            emulatorNames = {}
+            for serial, device in devices.items():
+                if serial.startswith("emulator-") and device["state"] == "device":
+                    emulatorNames[serial] = self.emulatorNames.get(serial) or self.get_emulator_name(serial)
+
+            with self.lock:
+                self.androidDevices = devices
+                self.emulatorNames = emulatorNames
+                self.androidLive = True
+            set_future_result(self.androidReady, True)
+
+    def get_emulator_name(self, serial):
+        try:
+            output = subprocess.check_output([self.adb, "-s", serial, "emu", "avd", "name"], stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=DEVICE_POLL_INTERVAL)
+        except (OSError, subprocess.SubprocessError):
+            return ""
+        lines = output.decode("utf-8", "replace").splitlines()
+        return lines[0].strip() if len(lines) > 0 else ""
+
+    #idevice_id only lists the connected devices, which is much cheaper than `ti info`.
+    #The name of a device is read once, when it connects
+    def poll_ios(self, idevice):
+        idevicename = shutil.which("idevicename")
+        while not self.stopped:
+            try:
+                output = subprocess.check_output([idevice, "-l"], stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=DEVICE_POLL_INTERVAL)
+                devices = {}
+                for line in output.decode("utf-8", "replace").splitlines():
+                    if line.strip() != "":
+                        udid = line.split()[0]
+                        devices[udid] = self.iosDevices.get(udid) or self.get_ios_name(idevicename, udid)
+                with self.lock:
+                    self.iosDevices = devices
+                    self.iosLive = True
+            except (OSError, subprocess.SubprocessError):
+                with self.lock:
+                    self.iosLive = False
+            set_future_result(self.iosReady, self.iosLive)
+            time.sleep(DEVICE_POLL_INTERVAL)
+
+    def get_ios_name(self, idevicename, udid):
+        if idevicename is None:
+            return ""
+        try:
+            output = subprocess.check_output([idevicename, "-u", udid], stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=DEVICE_POLL_INTERVAL)
+        except (OSError, subprocess.SubprocessError):
+            return ""
+        return output.decode("utf-8", "replace").strip()
+
+    #Returns the Android devices that are ready to install on, as [name, serial] options
+    def get_android_device_options(self):
+        with self.lock:
+            devices = self.androidDevices
+        options = []
+        for serial in sorted(devices):
+            device = devices[serial]
+            if device["state"] == "device" and not serial.startswith("emulator-"):
+                options.append([device.get("model", serial).replace("_", " "), serial])
+        return options
+
+    #Returns the AVD names of the emulators that are running
+    def get_running_emulators(self):
+        with self.lock:
+            return set(name for name in self.emulatorNames.values() if name != "")
+
+    #Returns the connected iOS devices, as {udid: name}
+    def get_ios_devices(self):
+        with self.lock:
+            return dict(self.iosDevices)
+
+def get_device_tracker():
+    global deviceTracker
+    if deviceTracker is None:
+        settings = sublime.load_settings('Titanium.sublime-settings')
+        if settings.get("trackDevices", True) is False:
+            deviceTracker = DeviceTracker(None, False)
+        else:
+            deviceTracker = DeviceTracker(find_adb(settings), True)
+        deviceTracker.start()
+    return deviceTracker
+
+def plugin_unloaded():
+    if deviceTracker is not None:
+        deviceTracker.stop()
+
+
+#---------------------------------------------------------------------------
+# PREWARMING
+# Loads the build environment and sdk versions in the background as soon as
+# a Titanium project is opened, so they are ready when a build is started
+#---------------------------------------------------------------------------
+
+prewarmedWindows = {}
+
+def prewarm_window(window):
+    if window is None:
+        return
+
+    now = time.time()
+    if now - prewarmedWindows.get(window.id(), 0) < PREWARM_INTERVAL:
+        return
+    prewarmedWindows[window.id()] = now
+
+    #The folders that aren't in the project index yet are searched first, in the background
+    projects, pending = get_window_projects(window)
+    if len(pending) > 0:
+        prewarmPool.submit(lambda: (wait(pending), prewarm_projects(window, get_window_projects(window)[0])))
+    else:
+        prewarm_projects(window, projects)
+
+def prewarm_projects(window, projects):
+    if len(projects) == 0:
+        return
+
+    settings = sublime.load_settings('Titanium.sublime-settings')
+    if settings.get("prewarmEnvironment", True) is False:
+        return
+
+    #Prewarming can't prompt for credentials, so it only runs when they are stored in the settings
+    appc = settings.get("appceleratorPath", "/usr/local/bin/appc")
+    user = settings.get("appceleratorUsername", "")
+    password = settings.get("appceleratorPassword", "")
+    ttl = settings.get("environmentCacheTTL", 86400)
+    if user == "" or password == "":
+        return
+    get_device_tracker()
+
+    for platform in settings.get("prewarmPlatforms", ENVIRONMENT_PLATFORMS):
+        load_environment_info(appc, user, password, ttl, platform, True)
+    for project in projects:
+        if project.sdkVersion == "":
+            load_sdk_version(appc, user, password, project.path, True)
+
+def plugin_loaded():
+    sublime.set_timeout_async(lambda: prewarm_window(sublime.active_window()), 1000)
+
+class TitaniumPrewarmListener(sublime_plugin.EventListener):
+
+    def on_activated_async(self, view):
+        prewarm_window(view.window())
+
+
+#---------------------------------------------------------------------------
+# COMPLETIONS
+# Completes the Titanium API in the JS files of Titanium projects. The API is held
+# in a trie of namespaces, so only the members of the namespace being typed are offered
+#---------------------------------------------------------------------------
+
+#The Titanium API completions that ship with the package, loaded the first time they are needed
+COMPLETIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Titanium.completions.json")
+
+#The dotted name before the cursor, such as Ti.UI.createW
+COMPLETION_NAME_PATTERN = re.compile(r'((?:[A-Za-z_$][\w$]*\.)*)([\w$]*)$')
+
+#Bump this whenever the format of the completion index files changes
+COMPLETION_INDEX_VERSION = 1
+
+#Folders the Titanium SDKs are installed in, on each OS. More can be added with the titaniumSDKFolders setting
+SDK_FOLDERS = [
+    "~/Library/Application Support/Titanium/mobilesdk/osx",
+    "/Library/Application Support/Titanium/mobilesdk/osx",
+    "~/.titanium/mobilesdk/linux",
+    os.path.join(os.environ.get("ProgramData", ""), "Titanium", "mobilesdk", "win32"),
+    os.path.join(os.environ.get("APPDATA", ""), "Titanium", "mobilesdk", "win32")
+]
+
+#Loaded completion indexes, keyed by SDK version, or by the file they were loaded from for the completions shipped with the package
+completionIndexes = {}
+
+#Completion indexes that couldn't be loaded, with the error, keyed like completionIndexes.
+#They aren't loaded again until the plugin is reloaded
+completionIndexErrors = {}
+
+#The project folder of each folder holding source files, or None outside of Titanium projects
+projectFolders = {}
+
+class CompletionNode(object):
+    __slots__ = ["children", "contents"]
+
+    def __init__(self):
+        #Members of the namespace, keyed by name
+        self.children = None
+        #Snippet inserted for a method
+        self.contents = None
+
+class CompletionIndex(object):
+
+    #Namespaces that are also known by another name
+    ALIASES = {"Titanium": "Ti"}
+
+    def __init__(self):
+        self.root = CompletionNode()
+
+    #Adds a dotted name, such as Ti.UI.createWindow, along with the snippet inserted for its last part
+    def add(self, name, contents=None):
+        node = self.root
+        for part in name.split("."):
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(part)
+            if child is None:
+                child = CompletionNode()
+                node.children[part] = child
+            node = child
+        if contents is not None:
+            node.contents = contents
+
+    #Builds the index from the entries of a .sublime-completions file
+    @classmethod
+    def from_completions(cls, completions):
+        index = cls()
+        for completion in completions:
+            if isinstance(completion, dict):
+                trigger, contents = completion["trigger"], completion["contents"]
+            else:
+                trigger, contents = completion, None
+            name = trigger[:-2] if trigger.endswith("()") else trigger
+            #The members of Global, such as require and console, are globals
+            if name.startswith("Global."):
+                name = name[len("Global."):]
+                contents = contents[len("Global."):] if contents is not None else None
+            #The namespace has already been typed, so only the member is inserted
+            if contents is not None:
+                contents = contents[name.rfind(".") + 1:]
+            index.add(name, contents)
+        return index
+
+    def find(self, namespace):
+        node = self.root
+        for i, part in enumerate(namespace):
+            if i == 0:
+                part = self.ALIASES.get(part, part)
+            node = node.children.get(part) if node.children is not None else None
+            if node is None:
+                return None
+        return node
+
+    #Builds the index from the api.jsca file of a Titanium SDK
+    @classmethod
+    def from_api(cls, api):
+        index = cls()
+        for apiType in api.get("types", []):
+            typeName = apiType["name"]
+            if typeName == "Global":
+                prefix = ""
+            else:
+                if typeName == "Titanium" or typeName.startswith("Titanium."):
+                    typeName = "Ti" + typeName[len("Titanium"):]
+                index.add(typeName)
+                prefix = typeName + "."
+
+            for prop in apiType.get("properties", []):
+                index.add(prefix + prop["name"])
+            for function in apiType.get("functions", []):
+                params = ["${%d:%s}" % (i + 1, param["name"]) for i, param in enumerate(function.get("parameters", []))]
+                index.add(prefix + function["name"], function["name"] + "(" + ",".join(params) + ")")
+        return index
+
+    #Writes the index as a trie that CompletionIndexFile reads without loading it.
+    #Each node is its name, its snippet and the offsets of its children, sorted by name. Children are written before their parent
+    def write(self, path):
+        data = bytearray(b"TCI" + struct.pack("<BI", COMPLETION_INDEX_VERSION, 0))
+
+        def write_node(name, node):
+            children = [write_node(childName, node.children[childName]) for childName in sorted(node.children or {})]
+            offset = len(data)
+            nameBytes = name.encode("utf-8")
+            contentsBytes = (node.contents or "").encode("utf-8")
+            data.extend(struct.pack("<B", len(nameBytes)) + nameBytes)
+            data.extend(struct.pack("<H", len(contentsBytes)) + contentsBytes)
+            data.extend(struct.pack("<H%dI" % len(children), len(children), *children))
+            return offset
+
+        struct.pack_into("<I", data, 4, write_node("", self.root))
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    #Returns the members of the namespace (a list of names) as (name, snippet, has members) tuples,
+    #or None when there is no such namespace
+    def members(self, namespace):
+        node = self.find(namespace)
+        if node is None:
+            return None
+        return [(name, child.contents, child.children is not None) for name, child in (node.children or {}).items()]
+
+    #Returns the members of the namespace starting with the first letter of prefix,
+    #as [trigger, contents] pairs. Sublime narrows them down further as the rest is typed
+    def complete(self, namespace, prefix):
+        return complete_members(self.members(namespace), prefix)
+
+#A completion index written by CompletionIndex.write. The file is memory mapped,
+#so only the nodes of the namespaces being completed are ever read
+class CompletionIndexFile(object):
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != b"TCI" + struct.pack("<B", COMPLETION_INDEX_VERSION):
+            raise ValueError("Unsupported completion index " + path)
+        self.root = struct.unpack_from("<I", self.data, 4)[0]
+
+    #Returns the name, snippet and child offsets of the node at offset
+    def read_node(self, offset):
+        data = self.data
+        nameLength = data[offset]
+        name = data[offset + 1:offset + 1 + nameLength].decode("utf-8")
+        offset += 1 + nameLength
+        contentsLength = struct.unpack_from("<H", data, offset)[0]
+        contents = data[offset + 2:offset + 2 + contentsLength].decode("utf-8") if contentsLength > 0 else None
+        offset += 2 + contentsLength
+        childCount = struct.unpack_from("<H", data, offset)[0]
+        return name, contents, struct.unpack_from("<%dI" % childCount, data, offset + 2)
+
+    def read_name(self, offset):
+        return self.data[offset + 1:offset + 1 + self.data[offset]].decode("utf-8")
+
+    #Returns the child offsets of the namespace's node, or None when there is no such namespace
+    def find(self, namespace):
+        children = self.read_node(self.root)[2]
+        for i, part in enumerate(namespace):
+            if i == 0:
+                part = CompletionIndex.ALIASES.get(part, part)
+            low, high = 0, len(children)
+            while low < high:
+                middle = (low + high) // 2
+                if self.read_name(children[middle]) < part:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(children) or self.read_name(children[low]) != part:
+                return None
+            children = self.read_node(children[low])[2]
+        return children
+
+    def members(self, namespace):
+        children = self.find(namespace)
+        if children is None:
+            return None
+        members = []
+        for child in children:
+            name, contents, grandchildren = self.read_node(child)
+            members.append((name, contents, len(grandchildren) > 0))
+        return members
+
+    def complete(self, namespace, prefix):
+        return complete_members(self.members(namespace), prefix)
+
+#Returns the members starting with the first letter of prefix as [trigger, contents] pairs
+def complete_members(members, prefix):
+    first = prefix[:1].lower()
+    completions = []
+    for name, contents, hasMembers in members or []:
+        if not name.lower().startswith(first):
+            continue
+        if contents is not None:
+            completions.append([name + "()\tmethod", contents])
+        elif hasMembers:
+            completions.append([name + "\tnamespace", name])
+        else:
+            completions.append([name + "\tproperty", name])
+    completions.sort()
+    return completions
+
+def read_completion_index(path, lowPriority=False):
+    with open(path, "r") as f:
+        completions = json.load(f)["completions"]
+    index = CompletionIndex.from_completions(completions)
+    completionIndexes[path] = index
+    return index
+
+#Returns the api.jsca file of an installed Titanium SDK, or None if that version isn't installed
+def find_sdk_api_file(version):
+    settings = sublime.load_settings('Titanium.sublime-settings')
+    for folder in settings.get("titaniumSDKFolders", []) + SDK_FOLDERS:
+        path = os.path.join(expanduser(folder), version, "api.jsca")
+        if os.path.isfile(path):
+            return path
+    return None
+
+def get_completion_index_file(version):
+    folder = os.path.join(get_cache_folder(), "completions")
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    return os.path.join(folder, version + ".index")
+
+#Loads the completion index of an SDK version, generating it from the SDK's api.jsca the first time.
+#Falls back to the completions shipped with the package when the SDK isn't installed
+def read_sdk_completion_index(version, lowPriority=False):
+    index = None
+    api = find_sdk_api_file(version)
+    if api is not None:
+        path = get_completion_index_file(version)
+        try:
+            if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(api):
+                with open(api, "r", encoding="utf-8") as f:
+                    CompletionIndex.from_api(json.load(f)).write(path)
+            index = CompletionIndexFile(path)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            print("Titanium: unable to index the completions of SDK " + version + ": " + str(e))
+
+    if index is None:
+        index = completionIndexes.get(COMPLETIONS_FILE) or read_completion_index(COMPLETIONS_FILE)
+    completionIndexes[version] = index
+    return index
+
+#Returns the key of the project's completion index in completionIndexes: its SDK version, or the completions shipped with the package
+def get_completion_index_key(project=None):
+    tiapp = read_tiapp(project) if project is not None else None
+    version = tiapp["sdk-version"] if tiapp is not None else ""
+    return version if version != "" else COMPLETIONS_FILE
+
+#Returns the completion index of the project's SDK, or None while it is loading in the background, or if it couldn't be loaded
+def get_completion_index(project=None):
+    key = get_completion_index_key(project)
+    index = completionIndexes.get(key)
+    if index is None and key not in completionIndexErrors:
+        if key == COMPLETIONS_FILE:
+            future = submit_load(("completions", key), False, read_completion_index, key)
+        else:
+            future = submit_load(("completions", key), False, read_sdk_completion_index, key)
+        future.add_done_callback(lambda f: completion_index_loaded(key, f))
+    return index
+
+def completion_index_loaded(key, future):
+    if future.cancelled() or future.exception() is None:
+        return
+    with inflightLock:
+        if key in completionIndexErrors:
+            return
+        completionIndexErrors[key] = str(future.exception())
+    print("Titanium: unable to load the completions for " + key + ": " + completionIndexErrors[key])
+
+#Returns the Titanium project a file belongs to, which is the nearest folder above it holding a tiapp.xml
+def find_project_folder(path):
+    folder = os.path.dirname(path)
+    if folder in projectFolders:
+        return projectFolders[folder]
+
+    if is_titanium_project(folder):
+        project = folder
+    elif os.path.dirname(folder) == folder:
+        project = None
+    else:
+        project = find_project_folder(folder)
+    projectFolders[folder] = project
+    return project
+
+#Returns the Titanium project of the view's file. Unsaved views belong to the first Titanium project of their window
+def get_view_project(view):
+    if view.file_name() is not None:
+        return find_project_folder(view.file_name())
+
+    window = view.window()
+    for folder in (window.folders() if window is not None else []):
+        if is_titanium_project(folder):
+            return folder
+    return None
+
+class TitaniumCompletionListener(sublime_plugin.EventListener):
+
+    #Starts loading the completions as soon as a Titanium project's file is opened
+    def on_activated_async(self, view):
+        if view.match_selector(0, "source.js"):
+            project = get_view_project(view)
+            if project is not None:
+                get_completion_index(project)
+
+    def on_query_completions(self, view, prefix, locations):
+        point = locations[0]
+        project = get_view_project(view)
+        if not view.match_selector(point, "source.js") or project is None:
+            return None
+
+        index = get_completion_index(project)
+        if index is None:
+            return None
+
+        line = view.line(point)
+        text = view.substr(sublime.Region(max(line.begin(), point - 200), point))
+        match = COMPLETION_NAME_PATTERN.search(text)
+        namespace = match.group(1).split(".")[:-1]
+        if len(namespace) == 0:
+            if match.group(2) == "":
+                return None
+            return index.complete(namespace, match.group(2))
+
+        #Only the namespace's members make sense after a dot
+        return (index.complete(namespace, match.group(2)), sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+
+
+#---------------------------------------------------------------------------
+# TSS
+# Parses Alloy style sheets as they are edited, re-parsing only the rule blocks an edit
+# touches. Properties are completed and checked against the API of the project's SDK
+#---------------------------------------------------------------------------
+
+#The tokens of a style sheet. A newline followed by a rule on its own line (such as "Label": {)
+#is a token too, so a block that isn't closed yet doesn't run on to the end of the file
+TSS_TOKEN_PATTERN = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<open>[{\[])
+  | (?P<close>[}\]])
+  | (?P<rule>\n(?=["'][^"'\n]*["']\s*:\s*\{))
+''', re.S | re.X)
+
+TSS_RULE_OPEN_PATTERN = re.compile(r'\s*:\s*\{')
+TSS_KEY_PATTERN = re.compile(r'\s*:')
+
+#What comes before a property name being typed
+TSS_KEY_POSITION_PATTERN = re.compile(r'(?:^|[{,])\s*["\']?([\w$]*)$')
+
+#The element a selector such as Label[platform=ios] styles. Ids and classes can style any element
+TSS_ELEMENT_PATTERN = re.compile(r'[A-Za-z_]\w*')
+
+#Namespaces of the elements a rule can style, such as Label (Ti.UI.Label) or Annotation (Ti.Map.Annotation)
+TSS_ELEMENT_NAMESPACES = [["Ti", "UI"], ["Ti", "Map"], ["Ti", "UI", "iOS"], ["Ti", "UI", "Android"]]
+
+#Keys Alloy handles itself, on top of the properties of the element
+TSS_ALLOY_KEYS = ["platform", "formFactor", "id", "classes"]
+
+#Number of characters compared at once while looking for the part of the text an edit changed
+TSS_COMPARE_CHUNK = 65536
+
+#Parsed style sheets, keyed by view id
+tssDocuments = {}
+
+#Properties that can be styled for each element, keyed by completion index and element name
+tssProperties = {}
+
+class TssBlock(object):
+    __slots__ = ["begin", "end", "closed", "selector", "keys", "unknown"]
+
+    def __init__(self, begin, selector):
+        self.begin = begin
+        self.end = begin
+        #Whether the block ends with its closing brace. The end of a block that isn't closed depends on the text after it
+        self.closed = False
+        self.selector = selector
+        #The property names of the rule, as (name, begin, end) with offsets relative to the start of the block
+        self.keys = []
+        #The keys that aren't properties of the styled element, or None until they are checked
+        self.unknown = None
+
+#Parses the next rule block at or after pos. Returns None at the end of the text
+def parse_tss_block(text, pos):
+    for token in TSS_TOKEN_PATTERN.finditer(text, pos):
+        if token.lastgroup != "string":
+            continue
+        opening = TSS_RULE_OPEN_PATTERN.match(text, token.end())
+        if opening is not None:
+            break
+    else:
+        return None
+
+    block = TssBlock(token.start(), token.group()[1:-1])
+    depth = 1
+    for token in TSS_TOKEN_PATTERN.finditer(text, opening.end()):
+        kind = token.lastgroup
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if depth == 0:
+                block.end = token.end()
+                block.closed = True
+                return block
+        elif kind == "rule":
+            #The block isn't closed, so it ends where the next one starts
+            block.end = token.start()
+            return block
+        elif depth == 1 and (kind == "name" or kind == "string") and TSS_KEY_PATTERN.match(text, token.end()):
+            name = token.group().strip("\"'")
+            block.keys.append((name, token.start() - block.begin, token.end() - block.begin))
+
+    block.end = len(text)
+    return block
+
+#Returns the length of the text at the start of both strings.
+#The strings are compared a chunk at a time, then the chunk that differs is narrowed down
+def common_prefix_length(a, b):
+    length = 0
+    limit = min(len(a), len(b))
+    step = TSS_COMPARE_CHUNK
+    while step > 0:
+        while length + step <= limit and a[length:length + step] == b[length:length + step]:
+            length += step
+        step //= 2
+    return length
+
+#Returns the length of the text at the end of both strings, looking at most at their last aLimit and bLimit characters
+def common_suffix_length(a, b, aLimit, bLimit):
+    length = 0
+    limit = min(aLimit, bLimit)
+    step = TSS_COMPARE_CHUNK
+    while step > 0:
+        while length + step <= limit and a[len(a) - length - step:len(a) - length] == b[len(b) - length - step:len(b) - length]:
+            length += step
+        step //= 2
+    return length
+
+class TssDocument(object):
+
+    def __init__(self):
+        self.text = ""
+        self.blocks = []
+        self.index = None
+
+    #Parses the new text of the style sheet. Only the blocks between the first and last changed
+    #characters are parsed again. The blocks after them are kept, and moved by the change in length
+    def update(self, text):
+        old = self.text
+        start = common_prefix_length(old, text)
+        suffix = common_suffix_length(old, text, len(old) - start, len(text) - start)
+        oldEnd = len(old) - suffix
+        newEnd = len(text) - suffix
+        delta = len(text) - len(old)
+
+        blocks = self.blocks
+        first = 0
+        while first < len(blocks) and blocks[first].end <= start:
+            first += 1
+        while first > 0 and not blocks[first - 1].closed:
+            first -= 1
+        following = first
+        while following < len(blocks) and blocks[following].begin < oldEnd:
+            following += 1
+
+        parsed = []
+        pos = blocks[first - 1].end if first > 0 else 0
+        while True:
+            block = parse_tss_block(text, pos)
+            blockBegin = block.begin if block is not None else len(text) + 1
+            while following < len(blocks) and blocks[following].begin + delta < blockBegin:
+                following += 1
+            if block is None:
+                break
+            #From here on the text hasn't changed, so neither have the blocks
+            if block.begin >= newEnd and following < len(blocks) and blocks[following].begin + delta == block.begin:
+                break
+            parsed.append(block)
+            pos = block.end
+
+        kept = blocks[following:]
+        for block in kept:
+            block.begin += delta
+            block.end += delta
+        self.blocks = blocks[:first] + parsed + kept
+        self.text = text
+        return len(parsed)
+
+    #Returns the block the point is in, or None between blocks
+    def find_block(self, point):
+        low, high = 0, len(self.blocks)
+        while low < high:
+            middle = (low + high) // 2
+            if self.blocks[middle].end < point:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.blocks) and self.blocks[low].begin <= point:
+            return self.blocks[low]
+        return None
+
+    #Checks the keys of the blocks that haven't been checked against the index yet.
+    #Returns the regions of the unknown keys
+    def check(self, index):
+        if index is not self.index:
+            self.index = index
+            for block in self.blocks:
+                block.unknown = None
+
+        regions = []
+        for block in self.blocks:
+            if block.unknown is None:
+                properties = get_tss_properties(index, block.selector)
+                block.unknown = [(begin, end) for name, begin, end in block.keys if name not in properties]
+            for begin, end in block.unknown:
+                regions.append(sublime.Region(block.begin + begin, block.begin + end))
+        return regions
+
+#Returns the property names that can be styled for the selector's element, which is looked up in TSS_ELEMENT_NAMESPACES.
+#Ids, classes and unknown elements can style the properties of any element
+def get_tss_properties(index, selector):
+    element = TSS_ELEMENT_PATTERN.match(selector)
+    element = element.group() if element is not None else ""
+    key = (id(index), element)
+    properties = tssProperties.get(key)
+    if properties is not None:
+        return properties
+
+    properties = set()
+    found = False
+    for namespace in TSS_ELEMENT_NAMESPACES:
+        members = index.members(namespace + [element]) if element != "" else None
+        if members is not None:
+            found = True
+            properties.update(name for name, contents, hasMembers in members if contents is None)
+    if not found:
+        for namespace in TSS_ELEMENT_NAMESPACES:
+            for name, contents, hasMembers in index.members(namespace) or []:
+                if hasMembers and name[:1].isupper():
+                    properties.update(get_tss_properties(index, name))
+    properties.update(TSS_ALLOY_KEYS)
+    tssProperties[key] = properties
+    return properties
+
+class TitaniumTssListener(sublime_plugin.EventListener):
+
+    def on_activated_async(self, view):
+        if view.id() not in tssDocuments:
+            self.check(view)
+
+    def on_modified_async(self, view):
+        self.check(view)
+
+    def on_close(self, view):
+        tssDocuments.pop(view.id(), None)
+
+    #Parses what changed in the style sheet and flags the unknown properties
+    def check(self, view):
+        if not view.match_selector(0, "source.tss"):
+            return
+        project = get_view_project(view)
+        if project is None:
+            return
+
+        document = tssDocuments.get(view.id())
+        if document is None:
+            document = TssDocument()
+            tssDocuments[view.id()] = document
+        document.update(view.substr(sublime.Region(0, view.size())))
+
+        index = get_completion_index(project)
+        if index is None:
+            #Check again once the index has loaded, unless it couldn't be loaded
+            if get_completion_index_key(project) not in completionIndexErrors:
+                sublime.set_timeout_async(lambda: self.check(view), 500)
+            return
+        view.add_regions("titanium_tss_unknown", document.check(index), "invalid", "",
+            sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE | sublime.DRAW_SQUIGGLY_UNDERLINE)
+
+    #Completes the properties of the element a rule styles, and constants such as Ti.UI.FILL in values
+    def on_query_completions(self, view, prefix, locations):
+        point = locations[0]
+        if not view.match_selector(point, "source.tss"):
+            return None
+        project = get_view_project(view)
+        document = tssDocuments.get(view.id())
+        index = get_completion_index(project) if project is not None else None
+        if document is None or index is None:
+            return None
+
+        line = view.line(point)
+        text = view.substr(sublime.Region(max(line.begin(), point - 200), point))
+        block = document.find_block(point)
+        if block is not None and TSS_KEY_POSITION_PATTERN.search(text) is not None:
+            first = prefix[:1].lower()
+            properties = [name for name in get_tss_properties(index, block.selector) if name.lower().startswith(first)]
+            return ([[name + "\tproperty", name + ": "] for name in sorted(properties)], sublime.INHIBIT_WORD_COMPLETIONS)
+
+        match = COMPLETION_NAME_PATTERN.search(text)
+        namespace = match.group(1).split(".")[:-1]
+        if len(namespace) == 0:
+            return None
+        return (index.complete(namespace, match.group(2)), sublime.INHIBIT_WORD_COMPLETIONS | sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+
+
 class TitaniumCommand(sublime_plugin.WindowCommand):
 
-    def run(self, *args, **kwargs):
+    #Runs a build. When a preset name is passed, the preset's build options are used and no dialogs are shown.
+    #The preset is looked up in the given project folder, or in all of the window's folders.
+    #The preset can also be the build options themselves, for the given project folder.
+    #The output is shown in the given output panel. The username, password and keystorePassword
+    #arguments are used instead of prompting for them (by the build matrix, for example)
+    def run(self, preset=None, project=None, panel="titanium", username=None, password=None, keystorePassword=None, forceRebuild=False, *args, **kwargs):
         settings = sublime.load_settings('Titanium.sublime-settings')
         self.appc               = settings.get("appceleratorPath", "/usr/local/bin/appc")
         self.loggingLevel       = settings.get("loggingLevel", "info")
@@ -16,6 +3144,8 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         self.appcPass           = settings.get("appceleratorPassword", "")
         self.iosBuildFamily     = settings.get("iosBuildFamily", False)
         self.androidSDK         = settings.get("androidSDK", "")
+        self.environmentCacheTTL = settings.get("environmentCacheTTL", 86400)
+        self.captureFullLog     = settings.get("captureFullLog", True)
 
 
         #Options for the various dialogs that the user chooses from to create the build command
@@ -28,25 +3158,43 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         self.buildOpts = []
 
         self.multipleFolders = False
+        self.projects = []
+        self.project = None
         self.projectFolder = ""
         self.projectSDK = ""
         self.keystorePassword = ""
         self.keyAlias         = ""
         self.deviceID = ""
-        self.androidEmulators = []
-        self.androidDevices = []
-        self.iosSimulators = []
-        self.iosDevices = []
-        self.iosDeveloperCertificates = []
-        self.iosDeveloperProvisioning = []
-        self.iosDistributionCertificates = []
-        self.iosDistributionProvisioning = []
-        self.iosAdhocProvisioning = []
+        self.deviceName = ""
+        self.family = ""
+        self.iosCert = ""
+        self.iosProvisioningProfile = ""
+        self.deployType = ""
+        self.presetName = preset
+        self.presetProject = project
+        self.panel = panel
+        self.runner = None
+        self.failed = False
+        self.reused = False
+        self.forceRebuild = forceRebuild
+        if username is not None and password is not None:
+            self.appcUser = username
+            self.appcPass = password
+        if keystorePassword is not None:
+            self.keystorePassword = keystorePassword
+        self.mostRecent = get_most_recent_build(get_project_paths(self.window))
+        self.sdkFuture = None
+        self.sessionFuture = None
+        self.environmentFuture = None
+        self.projectVersionFuture = None
+        self.environment = None
+        self.distBuild = None
+        self.timer = BuildTimer()
 
         if (self.appcUser == ""):
-            self.show_input_panel("Appcelerator Username", self.appcUser, self.set_appc_username, self.cancel)
+            self.show_input_panel("Appcelerator Username", self.appcUser, self.set_appc_username, self.cancel, "credentials")
         elif (self.appcPass == ""):
-            self.show_input_panel("Appcelerator Password", self.appcPass, self.set_appc_password, self.cancel)
+            self.show_input_panel("Appcelerator Password", self.appcPass, self.set_appc_password, self.cancel, "credentials")
         else:
             #Prompt the user to select a project, and set the project info (folder, sdk, etc) accordingly
             self.load_project()
@@ -62,7 +3210,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
 
         self.appcUser = value
         if (self.appcPass == ""):
-            self.show_input_panel("Appcelerator Password", self.appcPass, self.set_appc_password, self.cancel)
+            self.show_input_panel("Appcelerator Password", self.appcPass, self.set_appc_password, self.cancel, "credentials")
         else:
             #Prompt the user to select a project, and set the project info (folder, sdk, etc) accordingly
             self.load_project()
@@ -84,36 +3232,36 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
     
     def load_project(self):
         self.projectFolder = ""
-        folders = self.window.folders()
-        if len(folders) <= 0:
+        self.project = None
+        if self.presetName is not None:
+            self.load_preset()
+        elif len(self.window.folders()) <= 0:
             self.show_quick_panel(["ERROR: Must have a project open"], None)
         else:
-            if len(folders) == 1:
-                self.multipleFolders = False
-                self.projectFolder = folders[0]
-                self.load_project_complete()
+            #Waits for the folders that haven't been searched for projects yet
+            projects, pending = get_window_projects(self.window)
+            if len(pending) > 0:
+                self.wait_for(pending[0], lambda result: self.load_project())
             else:
-                self.multipleFolders = True
-                if self.useProjectNames == True:
-                    projectFolders = self.get_project_folders()
-                    projectNames = []
-                    for val in projectFolders:
-                        projectNames.append(val['name'])
-                    self.pick_project_name(projectNames)
-                else:
-                    self.pick_project_folder(folders)
+                self.pick_project(projects)
     
     def load_project_complete(self):
         #If the project folder is not set, there was an error, or the "most recent configuration" option was selected
         if self.projectFolder == "":
             return
 
-        self.projectSDK = self.load_sdk_version()
-
-
-        #Now load the environment info (available devices, certificates, emulators, etc)
-        self.load_environment_info()
-
+        #Load the sdk version in the background while the platform is picked, unless the project index already has it.
+        #The environment info is only loaded for the platform that is picked, in select_platform
+        if self.project is not None and self.project.sdkVersion != "":
+            self.sdkFuture = completed_future(self.project.sdkVersion)
+        else:
+            self.sdkFuture = load_sdk_version(self.appc, self.appcUser, self.appcPass, self.projectFolder)
+            self.timer.track("sdk_version", self.sdkFuture)
+        if self.project is not None and self.project.version != "":
+            self.projectVersionFuture = completed_future(self.project.version)
+        self.sessionFuture = load_session(self.appc, self.appcUser, self.appcPass)
+        self.timer.track("session", self.sessionFuture)
+        self.show_progress()
 
         #Choose Which Platform to build for
         self.pick_platform()
@@ -122,64 +3270,56 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
     #Load Project Dialogs
     #--------------------
 
-    #Shows a dialog containing the list of currently open projects (by name)
-    def pick_project_name(self, projects):
-        # only show most recent when there is a command stored
-        if 'titaniumMostRecent' in globals():
-            projects.insert(0, 'most recent configuration')
-
-        self.show_quick_panel(projects, self.select_project_name)
+    #Shows a dialog containing the projects in the open folders, along with their app id, SDK and version.
+    #The folders themselves are listed when none of them holds a Titanium project
+    def pick_project(self, projects):
+        if len(projects) == 0:
+            projects = [ProjectEntry(folder, None) for folder in self.window.folders()]
+        self.projects = projects
 
-    #Sets the projectFolder that will be the build target based on the name of the project the user selected
-    def select_project_name(self, select):
-        if select < 0:
+        if len(projects) == 1:
+            self.multipleFolders = False
+            self.select_project(0)
             return
 
-        # if most recent was an option, we need subtract 1
-        # from the selected index to match the folders array
-        # since the "most recent" option was inserted at the beginning
-        if 'titaniumMostRecent' in globals():
-            select = select - 1
-
-        if select == -1:
-            self.window.run_command("exec", titaniumMostRecent)
-        else:
-            projectFolders = self.get_project_folders()
-            self.projectFolder = projectFolders[select]['path']
-            self.load_project_complete()
-
-    #Shows a dialog containing the list of currently open projects (by folder)
-    def pick_project_folder(self, folders):
-        folderNames = []
-        for folder in folders:
-            index = folder.rfind('/') + 1
-            if index > 0:
-                folderNames.append(folder[index:])
-            else:
-                folderNames.append(folder)
-
-        # only show most recent when there is a command stored
-        if 'titaniumMostRecent' in globals():
-            folderNames.insert(0, 'most recent configuration')
-
-        self.show_quick_panel(folderNames, self.select_project_folder)
-
-    #Sets the projectFolder that will be the build target based on the project folder the user selected
-    def select_project_folder(self, select):
-        folders = self.window.folders()
+        self.multipleFolders = True
+        names = {}
+        if self.useProjectNames == True:
+            for folder in self.get_project_folders():
+                if "name" in folder:
+                    names[folder["path"]] = folder["name"]
+
+        options = []
+        for project in projects:
+            details = [project.appId]
+            if project.sdkVersion != "":
+                details.append("SDK " + project.sdkVersion)
+            if project.version != "":
+                details.append(project.version)
+            options.append([names.get(project.path, project.name), " | ".join(details), project.path])
+
+        # only show most recent when there is a build stored for one of the projects
+        if self.mostRecent is not None:
+            options.insert(0, [MOST_RECENT_BUILD, get_preset_name(self.mostRecent), self.mostRecent["project"]])
+
+        self.show_quick_panel(options, self.select_project)
+
+    #Sets the projectFolder that will be the build target based on the project the user selected
+    def select_project(self, select):
         if select < 0:
             return
 
         # if most recent was an option, we need subtract 1
-        # from the selected index to match the folders array
+        # from the selected index to match the projects array
         # since the "most recent" option was inserted at the beginning
-        if 'titaniumMostRecent' in globals():
+        if self.multipleFolders == True and self.mostRecent is not None:
             select = select - 1
 
         if select == -1:
-            self.window.run_command("exec", titaniumMostRecent)
+            self.run_preset(self.mostRecent["project"], self.mostRecent)
         else:
-            self.projectFolder = folders[select]
+            self.project = self.projects[select]
+            self.projectFolder = self.project.path
             self.load_project_complete()
 
 
@@ -191,8 +3331,8 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
     #Shows a dialog containing the different platforms (android, ios, mobileweb) that the user can build for
     def pick_platform(self):
         # only show most recent when there are NOT multiple top level folders
-        # and there is a command stored
-        if self.multipleFolders == False and 'titaniumMostRecent' in globals():
+        # and there is a build stored for this project
+        if self.multipleFolders == False and self.mostRecent is not None:
             self.platforms.insert(0, 'most recent configuration')
 
         self.show_quick_panel(self.platforms, self.select_platform)
@@ -204,30 +3344,41 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         self.platform = self.platforms[select]
 
         #Now that we know that platform the user is building for, we can set additional build options
-        if self.platform == "most recent configuration":
-            self.window.run_command("exec", titaniumMostRecent)
+        if self.platform == MOST_RECENT_BUILD:
+            self.run_preset(self.mostRecent["project"], self.mostRecent)
         elif self.platform == "clean":
-            self.window.run_command("exec", {"cmd": [self.appc, "ti", "clean", "--username", self.appcUser, "--password", self.appcPass, "--no-banner", "--no-colors", "--project-dir", self.projectFolder]})
+            self.with_session(self.run_clean_command)
         else:
-            self.set_build_options()        
+            #Load the environment info (available devices, certificates, emulators, etc) for the picked platform only.
+            #Each step waits only for the data it needs
+            if self.platform in ENVIRONMENT_PLATFORMS:
+                get_device_tracker()
+                self.environmentFuture = load_environment_info(self.appc, self.appcUser, self.appcPass, self.environmentCacheTTL, self.platform)
+                self.timer.track("environment", self.environmentFuture)
+                self.show_progress()
+            self.set_build_options()
 
     #Based on the platform being built for, starts the process of showing various build options
     #This function will show an input panel, and will then call a platform specific callback in the form:
     #select_<platform>_target
     def set_build_options(self):
         if self.platform == "ios":
-            if len(self.iosDistributionProvisioning) < 1:
-                self.iosTargets.remove('dist-appstore')
-            if len(self.iosAdhocProvisioning) < 1:
-                self.iosTargets.remove('dist-adhoc')
-
-            self.show_quick_panel(self.iosTargets, self.select_ios_target)
+            self.with_environment(self.pick_ios_target)
         elif self.platform == "android":
             self.show_quick_panel(self.androidTargets, self.select_android_target)
         elif self.platform == "mobileweb":
             self.show_quick_panel(self.webTargets, self.select_mobileweb_target)
 
 
+    def pick_ios_target(self):
+        if len(self.environment.profiles["distribution"]) < 1:
+            self.iosTargets.remove('dist-appstore')
+        if len(self.environment.profiles["adhoc"]) < 1:
+            self.iosTargets.remove('dist-adhoc')
+
+        self.show_quick_panel(self.iosTargets, self.select_ios_target)
+
+
     #--------------------------------------------------------------
     # 3. ANDROID METHODS & BUILD OPTIONS
     #    Show dialogs and set options for android platform builds
@@ -240,8 +3391,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         self.deviceID = ""
 
         if (self.target == "emulator"):
-            self.load_android_emulator_options()
-            self.show_quick_panel(self.emulatorOptions, self.select_android_emulator)
+            self.with_environment(self.pick_android_emulator)
         elif (self.target == "distribution"):
             self.target = "dist-playstore"
             if self.androidKeystore == "":
@@ -250,15 +3400,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
                 self.show_input_panel("Keystore password", self.keystorePassword, self.set_android_keystore_password, self.cancel)
         else: 
             #self.target == device
-            #if (len(self.androidDevices) < 1):
-            #    sublime.error_message("No Android Devices Connected")
-            #    return
-            #elif (len(self.androidDevices) == 1):
-            #    self.deviceID = self.androidDevices[0]["id"]
-                self.android_options_complete()
-            #else:
-            #    self.load_android_device_options()
-            #    self.show_quick_panel(self.deviceOptions, self.select_android_device)
+            self.wait_for(get_device_tracker().androidReady, lambda live: self.pick_android_device())
 
     def android_options_complete(self):
         buildOpts = []
@@ -270,17 +3412,25 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
             buildOpts.extend(["--device-id", self.deviceID])
 
         if self.target == "dist-playstore":
-            project_version = self.get_project_version()
-            output_folder = self.projectFolder + "/dist/" + project_version
-            buildOpts.extend(["--keystore", self.androidKeystore, "--store-password", self.keystorePassword, "--alias", self.keyAlias, "--output-dir", output_folder])
+            def version_loaded(project_version):
+                output_folder = self.projectFolder + "/dist/" + project_version
+                buildOpts.extend(["--keystore", self.androidKeystore, "--store-password", self.keystorePassword, "--alias", self.keyAlias, "--output-dir", output_folder])
+                self.run_dist(output_folder, buildOpts)
 
-        self.run_titanium(buildOpts)
+            self.with_project_version(version_loaded)
+        else:
+            self.run_titanium(buildOpts)
 
     # EMULATOR BUILD PATH    
+    def pick_android_emulator(self):
+        self.load_android_emulator_options()
+        self.show_quick_panel(self.emulatorOptions, self.select_android_emulator)
+
     def select_android_emulator(self, select):
         if select < 0:
             return
-        self.deviceID = "\"" + self.emulatorOptions[select][0] + "\""
+        self.deviceID = self.emulatorOptions[select][0]
+        self.deviceName = self.emulatorOptions[select][0]
         self.android_options_complete()
 
 
@@ -304,27 +3454,49 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         self.android_options_complete()
 
     #DEVICE BUILD PATH    
+    #The connected devices come from the device tracker, or from the environment info when adb isn't being tracked.
+    #When neither lists a device, the CLI picks the device itself
+    def pick_android_device(self):
+        tracker = get_device_tracker()
+        if tracker.androidLive:
+            self.show_android_devices(tracker.get_android_device_options())
+        else:
+            self.with_environment(self.pick_environment_android_device)
+
+    def pick_environment_android_device(self):
+        if len(self.environment.deviceOptions) < 1:
+            self.android_options_complete()
+        else:
+            self.show_android_devices(self.environment.deviceOptions)
+
+    def show_android_devices(self, options):
+        self.deviceOptions = options
+        if len(options) < 1:
+            self.fail("Titanium: No Android devices connected")
+        elif len(options) == 1:
+            self.select_android_device(0)
+        else:
+            self.show_quick_panel(options, self.select_android_device)
+
     def select_android_device(self, select):
-        if select == "":
+        if select < 0:
             return
         self.deviceID = self.deviceOptions[select][1]
+        self.deviceName = self.deviceOptions[select][0]
         self.android_options_complete()
     
 
     # Android Helpers
     #----------------
 
+    #Marks the emulators that are running, and adds running emulators that `ti info` didn't list
     def load_android_emulator_options(self):
+        running = get_device_tracker().get_running_emulators()
         self.emulatorOptions = []
-        for obj in self.androidEmulators:
-            subtitle = "Android " + obj["sdk-version"] + " (" + obj["type"] + ")"
-            self.emulatorOptions.append([obj["name"], subtitle])
-
-    def load_android_device_options(self):
-        self.deviceOptions = []
-        for obj in self.androidDevices:
-            name = obj["brand"] + " " + obj["manufacturer"] + " (" + obj["model"] + ") Android " + obj["release"]
-            self.deviceOptions.append([name, obj["id"]])
+        for name, subtitle in self.environment.emulatorOptions:
+            self.emulatorOptions.append([name, subtitle + " - running" if name in running else subtitle])
+        known = set(option[0] for option in self.emulatorOptions)
+        self.emulatorOptions.extend([name, "running"] for name in sorted(running) if name not in known)
 
 
 
@@ -338,6 +3510,7 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
             return
         self.target = self.iosTargets[select]
         if self.target == "simulator":
+            #The environment info has already been loaded by pick_ios_target
             self.load_ios_simulator_options()
             self.show_quick_panel(self.emulatorOptions, self.select_ios_simulator)
         elif self.iosBuildFamily != False and self.iosBuildFamily in self.iosFamilies:
@@ -375,18 +3548,22 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
             buildOpts.extend(["--device-family", self.family, "--developer-name", self.iosCert, "--pp-uuid", self.iosProvisioningProfile])
 
         if self.target == "dist-appstore" or self.target == "dist-adhoc":
-            project_version = self.get_project_version()
-            output_folder = self.projectFolder + "/dist/" + project_version
-            buildOpts.extend(["--device-family", self.family, "--distribution-name", self.iosCert, "--pp-uuid", self.iosProvisioningProfile, "--output-dir", output_folder])
+            def version_loaded(project_version):
+                output_folder = self.projectFolder + "/dist/" + project_version
+                buildOpts.extend(["--device-family", self.family, "--distribution-name", self.iosCert, "--pp-uuid", self.iosProvisioningProfile, "--output-dir", output_folder])
+                self.run_dist(output_folder, buildOpts)
 
-        self.run_titanium(buildOpts)
+            self.with_project_version(version_loaded)
+        else:
+            self.run_titanium(buildOpts)
 
 
     #SIMULATOR BUILD PATH
     def select_ios_simulator(self, select):
         if select < 0:
             return
-        self.deviceID = "\"" + self.emulatorOptions[select][1] + "\""
+        self.deviceID = self.emulatorOptions[select][1]
+        self.deviceName = self.emulatorOptions[select][0]
         self.ios_options_complete()
 
 
@@ -395,15 +3572,16 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         if select < 0:
             return
 
-        self.deviceID = "\"" + self.filteredIosDevices[select][1] + "\""
+        self.deviceID = self.filteredIosDevices[select][1]
+        self.deviceName = self.filteredIosDevices[select][0]
         self.pick_ios_certificate()
 
     #DEVICE & DIST BUILD PATH
     def pick_ios_certificate(self):
         if self.target == "device":
-            self.load_ios_cert_options(self.iosDeveloperCertificates)
+            self.load_ios_cert_options("developer")
         else:
-            self.load_ios_cert_options(self.iosDistributionCertificates)
+            self.load_ios_cert_options("distribution")
 
         if len(self.certOptions) < 1:
             return
@@ -417,16 +3595,16 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         if select < 0:
             return
 
-        self.iosCert = "\"" + self.certOptions[select][1] + "\""
+        self.iosCert = self.certOptions[select][1]
         self.pick_ios_provisioning_profile()
 
     def pick_ios_provisioning_profile(self):
         if self.target == "device":
-            self.load_ios_provisioning_profile_options(self.iosDeveloperProvisioning)
+            self.load_ios_provisioning_profile_options("development")
         elif self.target == "dist-appstore":
-            self.load_ios_provisioning_profile_options(self.iosDistributionProvisioning)
+            self.load_ios_provisioning_profile_options("distribution")
         else:
-            self.load_ios_provisioning_profile_options(self.iosAdhocProvisioning)
+            self.load_ios_provisioning_profile_options("adhoc")
 
         if len(self.provisioningProfiles) < 1:
             return
@@ -446,37 +3624,27 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
     # iOS Helpers
     #------------
     def load_ios_simulator_options(self):
-        self.emulatorOptions = []
-        for obj in self.iosSimulators:
-            title = obj["deviceName"] + " - iOS " + obj["version"]
-
-            self.emulatorOptions.append([title, obj["udid"]])
+        self.emulatorOptions = self.environment.simulatorOptions
 
+    #Leaves out the devices that have been disconnected, and adds the devices connected since `ti info` ran
     def filter_ios_devices(self):
-        self.filteredIosDevices = []
-        for obj in self.iosDevices:
-            if self.family != "universal" and "deviceClass" in obj and obj["deviceClass"] != self.family:
-                continue
-
-            name = obj["name"]
-            if 'deviceClass' in obj:
-                name = obj["deviceClass"] + " - " + name
-            if 'productType' in obj:
-                name += " (" + obj["productType"] + ")"
-            if 'productVersion' in obj:
-                name += " iOS " + obj["productVersion"]
-            self.filteredIosDevices.append([name, obj["udid"]])
+        options = self.environment.get_device_options(self.family)
+        tracker = get_device_tracker()
+        if tracker.iosLive:
+            connected = tracker.get_ios_devices()
+            known = set(device.udid for device in self.environment.devices)
+            options = [option for option in options if option[1] in connected]
+            options.extend([connected[udid] or udid, udid] for udid in sorted(connected) if udid not in known)
+        self.filteredIosDevices = options
 
-    def load_ios_cert_options(self, certArray): 
-        self.certOptions = []
-        for obj in certArray:
-            self.certOptions.append([obj["fullname"], obj["name"]])
+    def load_ios_cert_options(self, category):
+        self.certOptions = self.environment.certOptions[category]
 
-    def load_ios_provisioning_profile_options(self, profileArray):
-        self.provisioningProfiles = []
-        for obj in profileArray:
-            name = obj["name"] + " (" + obj["appId"] + ")"
-            self.provisioningProfiles.append([name, obj["uuid"]])
+    #Only shows the profiles that can sign the project's app id, when there are any
+    def load_ios_provisioning_profile_options(self, category):
+        tiapp = read_tiapp(self.projectFolder)
+        appId = tiapp["id"] if tiapp is not None else ""
+        self.provisioningProfiles = self.environment.get_profile_options(category, appId)
 
 
     #---------------------------------------------------------------
@@ -488,7 +3656,74 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         if select < 0:
             return
         self.target = "web"
-        self.run_titanium(["--deploy-type", self.webTargets[select]])
+        self.deployType = self.webTargets[select]
+        self.mobileweb_options_complete()
+
+    def mobileweb_options_complete(self):
+        self.run_titanium(["--deploy-type", self.deployType])
+
+
+    #---------------------------------------------------------------
+    # PRESETS
+    # Run a build using stored build options instead of dialogs
+    #---------------------------------------------------------------
+
+    def load_preset(self):
+        if isinstance(self.presetName, dict):
+            self.run_preset(self.presetProject, self.presetName)
+            return
+
+        folders = get_project_paths(self.window)
+        if self.presetProject is not None:
+            folders = [self.presetProject]
+
+        mostRecent = get_most_recent_build(folders)
+        if self.presetName == MOST_RECENT_BUILD and mostRecent is not None:
+            self.run_preset(mostRecent["project"], mostRecent)
+            return
+
+        for folder, name, preset in get_presets(folders):
+            if name == self.presetName:
+                self.run_preset(folder, preset)
+                return
+
+        self.fail("Titanium: No build preset named \"" + self.presetName + "\"")
+
+    #Sets the build options from the preset and runs the build, without loading the environment info
+    def run_preset(self, folder, preset):
+        self.projectFolder = folder
+        for key in PRESET_KEYS:
+            setattr(self, key, preset.get(key, ""))
+        self.deviceName = preset.get("deviceName", "")
+        self.sdkFuture = load_sdk_version(self.appc, self.appcUser, self.appcPass, self.projectFolder)
+        self.timer.track("sdk_version", self.sdkFuture)
+        self.sessionFuture = load_session(self.appc, self.appcUser, self.appcPass)
+        self.timer.track("session", self.sessionFuture)
+
+        if self.platform == "android":
+            if self.target == "dist-playstore" and self.keystorePassword == "":
+                #The keystore password is never stored
+                self.show_input_panel("Keystore password", "", self.set_preset_keystore_password, self.cancel)
+            else:
+                self.android_options_complete()
+        elif self.platform == "ios":
+            future = workerPool.submit(verify_ios_signing, self.appc, self.appcUser, self.environmentCacheTTL, preset)
+            self.timer.track("signing_check", future)
+            self.wait_for(future, self.ios_signing_verified)
+        else:
+            self.mobileweb_options_complete()
+
+    def set_preset_keystore_password(self, select):
+        if select == "":
+            return
+        self.keystorePassword = select
+        self.android_options_complete()
+
+    def ios_signing_verified(self, error):
+        if error is not None:
+            self.fail("Titanium: " + error)
+            return
+        self.ios_options_complete()
 
 
     #---------------------------------------------------------------------------
@@ -496,14 +3731,29 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
     # These functions are helpers that other methods use to get/set data
     #---------------------------------------------------------------------------
 
-    def show_quick_panel(self, options, done):
+    #The time the panels are open is recorded in the build timing, under the span name
+    def show_quick_panel(self, options, done, span="panels"):
+        if done is not None:
+            done = self.timed(span, done)
         #SublimeText3 requires a timeout before showing an input window
         sublime.set_timeout(lambda: self.window.show_quick_panel(options, done), 10)
 
-    def show_input_panel(self, caption, text, done, cancel):
+    def show_input_panel(self, caption, text, done, cancel, span="panels"):
+        done = self.timed(span, done)
+        cancel = self.timed(span, cancel)
         #SublimeText3 requires a timeout before showing an input window
         sublime.set_timeout(lambda: self.window.show_input_panel(caption, text, done, None, cancel), 10)
 
+    #Starts timing a span and returns a callback that stops timing it before calling callback
+    def timed(self, span, callback):
+        self.timer.start(span)
+
+        def stop(*args):
+            self.timer.stop(span)
+            return callback(*args)
+
+        return stop
+
     def get_project_folders(self):
         project = self.window.project_data()
         return project['folders']
@@ -512,83 +3762,177 @@ class TitaniumCommand(sublime_plugin.WindowCommand):
         #don't do anything
         return
 
-    def get_project_version(self):
-        process = subprocess.Popen([self.appc, "ti", "project", "version", "--username", self.appcUser, "--password", self.appcPass, "--project-dir", self.projectFolder, "--output=text", "--no-banner"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result, error = process.communicate()
-        return result.decode('utf-8').rstrip('\n')
+    #Stops the build with an error. The build matrix uses failed to tell that the build won't start
+    def fail(self, message):
+        self.failed = True
+        sublime.error_message(message)
+
+    #Calls done(result) on the UI thread once the future has finished, without blocking while it runs
+    def wait_for(self, future, done, waitStarted=None):
+        if not future.done():
+            if waitStarted is None:
+                waitStarted = time.time()
+            sublime.set_timeout(lambda: self.wait_for(future, done, waitStarted), 50)
+            return
 
-    def run_titanium(self, options=[]):
-        cmd = [self.appc, "run", "--username", self.appcUser, "--password", self.appcPass, "--sdk", self.projectSDK, "--project-dir", self.projectFolder, "--no-colors", "--no-banner", "--platform", self.platform, "--log-level", self.loggingLevel, "--target", self.target]
-        cmd.extend(options)
-        print("RUNNING COMMAND")
-        print(' '.join(cmd))
-        execCMD = {"cmd": ' '.join(cmd), "shell": True}
+        #Time spent waiting for background loads after the user has made their choice
+        if waitStarted is not None:
+            self.timer.add("waiting", time.time() - waitStarted)
 
-        # save most recent command
-        global titaniumMostRecent
-        titaniumMostRecent = execCMD
+        try:
+            result = future.result()
+        except Exception as e:
+            self.fail("Titanium Build Error:\n\n" + str(e))
+            return
 
-        self.window.run_command("exec", execCMD)
+        done(result)
+
+    #Shows the status of the background discovery calls in the status bar until they have all finished
+    def show_progress(self, tick=0):
+        pending = []
+        if self.sdkFuture is not None and not self.sdkFuture.done():
+            pending.append("SDK version")
+        if self.sessionFuture is not None and not self.sessionFuture.done():
+            pending.append("session")
+        if self.environmentFuture is not None and not self.environmentFuture.done():
+            pending.append("build environment")
+        if self.projectVersionFuture is not None and not self.projectVersionFuture.done():
+            pending.append("project version")
+
+        if len(pending) == 0:
+            sublime.status_message("")
+            return
 
-    #Uses appc ti project to figure out which Titanium SDK the targeted project uses
-    def load_sdk_version(self):
-        sublime.status_message("Getting SDK version...")
+        dots = "." * (tick % 4)
+        sublime.status_message("Titanium: loading " + ", ".join(pending) + dots)
+        sublime.set_timeout(lambda: self.show_progress(tick + 1), 250)
 
-        process = subprocess.Popen([self.appc, "ti", "project", "sdk-version", "--username", self.appcUser, "--password", self.appcPass, "--project-dir", self.projectFolder, "--output=text", "--no-banner"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result, error = process.communicate()
+    def with_sdk_version(self, done):
+        def loaded(sdk):
+            self.projectSDK = sdk
+            done()
 
-        sublime.status_message("")
+        self.wait_for(self.sdkFuture, loaded)
 
-        return result.decode('utf-8').rstrip('\n')
-    
-    #Uses appc info to get info about the various devices, emulators, certificates, sdk's and such that are installed
-    def load_environment_info(self):
-        sublime.status_message("Loading Build Environment Information...")
-        cmd = [self.appc, "ti", "info", "--username", self.appcUser, "--password", self.appcPass, "-o", "json", "--no-banner"]
+    def with_environment(self, done):
+        def loaded(env):
+            self.load_environment_info(env)
+            done()
+
+        self.wait_for(self.environmentFuture, loaded)
+
+    def with_project_version(self, done):
+        if self.projectVersionFuture is None:
+            self.projectVersionFuture = load_project_version(self.appc, self.appcUser, self.appcPass, self.projectFolder)
+            self.timer.track("project_version", self.projectVersionFuture)
+            self.show_progress()
+
+        self.wait_for(self.projectVersionFuture, done)
+
+    #Waits until the CLI is logged in, so the command can run without credentials
+    def with_session(self, done):
+        self.wait_for(self.sessionFuture, lambda result: done())
+
+    def run_titanium(self, options=[]):
+        self.with_sdk_version(lambda: self.with_session(lambda: self.run_titanium_command(options)))
+
+    #Reuses the artifacts of an identical distribution build in outputFolder, unless a rebuild is forced.
+    #Otherwise the build runs, and its manifest is written once it has succeeded
+    def run_dist(self, outputFolder, options):
+        def key_loaded(key):
+            artifacts = find_dist_build(outputFolder, key) if not self.forceRebuild else None
+            if artifacts is not None:
+                self.reused = True
+                message = os.path.relpath(outputFolder, self.projectFolder) + " was already built from the same sources, SDK and signing:\n"
+                message += "".join("  " + name + "\n" for name in artifacts)
+                message += "[Reused the build. Run \"Build: Titanium (Force Rebuild)\" to build it again]\n"
+                panel = self.window.create_output_panel(self.panel)
+                panel.run_command("append", {"characters": message, "force": True})
+                self.window.run_command("show_panel", {"panel": "output." + self.panel})
+                return
+
+            remove_dist_manifest(outputFolder, key)
+            self.distBuild = (outputFolder, key, get_dist_artifacts(outputFolder))
+            self.run_titanium(options)
+
+        def sdk_loaded():
+            future = workerPool.submit(get_dist_key, self.projectFolder, self.projectSDK, self.get_build_preset())
+            self.timer.track("dist_check", future)
+            self.wait_for(future, key_loaded)
+
+        self.with_sdk_version(sdk_loaded)
+
+    def run_clean_command(self):
+        self.window.run_command("titanium_exec", {"cmd": [self.appc, "ti", "clean", "--no-banner", "--no-colors", "--project-dir", self.projectFolder], "cwd": self.projectFolder, "level": self.loggingLevel, "panel": self.panel, "kind": "clean"})
+        self.build_started()
+
+    def run_titanium_command(self, options):
+        #When the full log is captured, the CLI logs everything and the output panel only shows the lines at loggingLevel and above
+        logLevel = "trace" if self.captureFullLog else self.loggingLevel
+        cmd = [self.appc, "run", "--sdk", self.projectSDK, "--project-dir", self.projectFolder, "--no-colors", "--no-banner", "--platform", self.platform, "--log-level", logLevel, "--target", self.target]
+        cmd.extend(options)
         print("RUNNING COMMAND")
-        print(' '.join(cmd))
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        result, error = process.communicate()
-        info = json.loads(result.decode('utf-8'))
-
-
-        self.androidEmulators = info["android"]["emulators"]
-        #self.androidDevices = info["android"]["devices"]
-        self.iosSimulators = []
-        self.iosDevices = []
-        self.iosDeveloperCertificates = []
-        self.iosDeveloperProvisioning = []
-        self.iosDistributionCertificates = []
-        self.iosDistributionProvisioning = []
-        self.iosAdhocProvisioning = []
-
-        for device in info["ios"]["devices"]:
-            self.iosDevices.append(device)
-
-        for name, arr in list(info["ios"]["simulators"]["ios"].items()):
-            for sim in arr:
-                self.iosSimulators.append(sim)
-
-        for cert in info["ios"]["certs"]["keychains"][expanduser("~") + "/Library/Keychains/login.keychain"]["developer"]:
-            if cert['expired'] is False:
-                #maybe this needs to be l.append([cert])
-                self.iosDeveloperCertificates.append(cert)
-
-        for cert in info["ios"]["certs"]["keychains"][expanduser("~") + "/Library/Keychains/login.keychain"]["distribution"]:
-            if cert['expired'] is False:
-                #maybe this needs to be l.append([cert])
-                self.iosDistributionCertificates.append(cert)
-
-        for profile in info["ios"]["provisioning"]["development"]:
-                if profile['expired'] is False:
-                    self.iosDeveloperProvisioning.append(profile)
-
-        for profile in info["ios"]["provisioning"]["distribution"]:
-                if profile['expired'] is False:
-                    self.iosDistributionProvisioning.append(profile)
-
-        for profile in info["ios"]["provisioning"]["adhoc"]:
-                if profile['expired'] is False:
-                    self.iosAdhocProvisioning.append(profile)
-
-        sublime.status_message("")
+        print(format_command(cmd))
+        execCMD = {"cmd": cmd, "cwd": self.projectFolder, "level": self.loggingLevel, "panel": self.panel}
+
+        # save most recent build, so it can be run again or saved as a preset
+        set_most_recent_build(self.projectFolder, self.get_build_preset())
+
+        self.window.run_command("titanium_exec", execCMD)
+        self.build_started()
+
+    #Records the time from starting the command to launching the build,
+    #then waits for the first line of output before saving the build timing
+    def build_started(self):
+        self.timer.add("total", time.time() - self.timer.started)
+        target = self.target if self.platform != "clean" else ""
+        runner = get_build_runner(self.window, self.panel)
+        self.runner = runner
+
+        def check_output():
+            if runner is not None and runner.firstOutput is None and not runner.finished:
+                sublime.set_timeout(check_output, 100)
+                return
+            if runner is not None and runner.firstOutput is not None:
+                self.timer.add("first_output", runner.firstOutput - runner.started)
+            record_build_timing(self.projectFolder, self.platform, target, self.timer.spans)
+
+        #The phases are recorded once the app is running (the CLI keeps running to show its log), or once the build has succeeded
+        phasesRecorded = False
+        def check_finished():
+            nonlocal phasesRecorded
+            if not phasesRecorded and not runner.killed and (runner.phases.complete or (runner.finished and runner.exitCode == 0)):
+                phasesRecorded = True
+                self.phases_finished(runner)
+            if not runner.finished:
+                sublime.set_timeout(check_finished, 500)
+            elif runner.exitCode == 0 and not runner.killed and self.distBuild is not None:
+                outputFolder, key, before = self.distBuild
+                workerPool.submit(write_dist_manifest, outputFolder, key, before)
+
+        check_output()
+        if runner is not None and self.platform != "clean":
+            check_finished()
+
+    #Records the build's phases, and warns about the phases that took much longer than they usually do
+    def phases_finished(self, runner):
+        durations = dict(runner.phases.durations)
+        durations["total"] = runner.phases.completed - runner.started
+        record_build_phases(self.projectFolder, self.platform, self.target, durations)
+
+        records = get_phase_groups(read_build_timings(PHASE_LOG)).get((self.projectFolder, self.platform, self.target), [])
+        regressions = get_phase_regressions(records)
+        if len(regressions) > 0:
+            message = ", ".join("%s took %.1fs (median %.1fs)" % (name, seconds, typical) for name, seconds, typical in regressions)
+            print("Titanium: slower build: " + message)
+            sublime.status_message("Titanium: slower build, " + message + ". See Titanium: Show Build Trends")
+
+    #Returns the resolved build options as a preset
+    def get_build_preset(self):
+        preset = dict((key, getattr(self, key)) for key in PRESET_KEYS)
+        preset["deviceName"] = self.deviceName
+        return preset
+
+    #Sets the info about the various devices, emulators, certificates, sdk's and such that are installed for the platform being built
+    def load_environment_info(self, env):
+        self.environment = env
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#Benchmarks for the Titanium build plugin that run offline, without Sublime Text, a Mac or an Appcelerator account.
+#
+#The plugin is loaded with the headless sublime stubs in bench/stubs, and the appc CLI is replaced by
+#bench/fake_appc.py, which returns synthetic data of a configurable size after a configurable delay.
+#
+#Usage: python3 bench/bench.py [--repeat N] [--simulators N] [--profiles N] [--delay S] [--info-delay S] [--output FILE]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_FOLDER = os.path.dirname(BENCH_FOLDER)
+FAKE_APPC = os.path.join(BENCH_FOLDER, "fake_appc.py")
+
+TIAPP = """<?xml version="1.0" encoding="UTF-8"?>
+<ti:app xmlns:ti="http://ti.appcelerator.org">
+    <id>com.example.app1</id>
+    <name>BenchApp</name>
+    <version>1.0.0</version>
+    <sdk-version>7.5.0.GA</sdk-version>
+</ti:app>
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Titanium build plugin")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each benchmark")
+    parser.add_argument("--simulators", type=int, default=50, help="number of ios simulators")
+    parser.add_argument("--profiles", type=int, default=100, help="number of provisioning profiles per category")
+    parser.add_argument("--delay", type=float, default=0.5, help="seconds each fake appc command takes to start")
+    parser.add_argument("--info-delay", type=float, default=1.0, help="extra seconds fake `ti info` takes")
+    parser.add_argument("--output", help="also write the results to this file")
+    return parser.parse_args()
+
+#Sets up a temporary home, cache and project folder, and imports the plugin against the sublime stubs
+def load_plugin(args, root):
+    os.environ["HOME"] = os.path.join(root, "home")
+    os.environ["FAKE_APPC_DELAY"] = str(args.delay)
+    os.environ["FAKE_APPC_INFO_DELAY"] = str(args.info_delay)
+    os.environ["FAKE_APPC_SIMULATORS"] = str(args.simulators)
+    os.environ["FAKE_APPC_PROFILES"] = str(args.profiles)
+    os.environ["FAKE_APPC_LOG"] = os.path.join(root, "appc.log")
+    os.makedirs(os.environ["HOME"])
+
+    sys.path.insert(0, os.path.join(BENCH_FOLDER, "stubs"))
+    sys.path.insert(0, PACKAGE_FOLDER)
+    sys.path.insert(0, BENCH_FOLDER)
+    import sublime
+    sublime.cachePath = os.path.join(root, "cache")
+    sublime.packagesPath = os.path.join(root, "packages")
+    sublime.load_settings("Titanium.sublime-settings").values.update({
+        "appceleratorPath": FAKE_APPC,
+        "appceleratorUsername": "bench",
+        "appceleratorPassword": "bench",
+        "prewarmEnvironment": False
+    })
+
+    import Titanium
+    return sublime, Titanium
+
+def make_project(root):
+    folder = os.path.join(root, "BenchApp")
+    os.makedirs(folder)
+    with open(os.path.join(folder, "tiapp.xml"), "w") as f:
+        f.write(TIAPP)
+    return folder
+
+#Forgets everything the plugin has cached, on disk and in memory
+def clear_caches(Titanium):
+    Titanium.clear_environment_cache()
+    Titanium.tiappCache.clear()
+
+def time_call(fn, repeat):
+    times = []
+    for i in range(repeat):
+        started = time.time()
+        fn()
+        times.append(time.time() - started)
+    return times
+
+#Times a full build, from TitaniumCommand.run until the build command is run
+def time_build(sublime, Titanium, folder, answers, repeat, cold, args=None):
+    times = []
+    for i in range(repeat):
+        if cold:
+            clear_caches(Titanium)
+        window = sublime.Window([folder])
+        window.answers = list(answers)
+        command = Titanium.TitaniumCommand(window)
+
+        started = time.time()
+        command.run(**(args or {}))
+        if not sublime.run_until(lambda: len(window.commands) > 0, 120):
+            raise RuntimeError("Build did not start: " + repr(sublime.errorMessages))
+        times.append(window.commands[0][0] - started)
+    return times
+
+def format_times(name, times):
+    return "  %-42s %9.1fms %9.1fms %9.1fms" % (name, min(times) * 1000, statistics.median(times) * 1000, max(times) * 1000)
+
+def main():
+    args = parse_args()
+    root = tempfile.mkdtemp(prefix="titanium-bench-")
+    try:
+        sublime, Titanium = load_plugin(args, root)
+        folder = make_project(root)
+        import fake_appc
+
+        lines = [
+            "Titanium build benchmarks (%d simulators, %d profiles per category, %.2fs CLI delay, %.2fs ti info delay)" % (args.simulators, args.profiles, args.delay, args.info_delay),
+            "",
+            "  %-42s %11s %11s %11s" % ("full build flow", "min", "median", "max")
+        ]
+        print("\n".join(lines))
+
+        builds = [
+            ("android emulator (cold)", ["android", "emulator", 0], True, None),
+            ("android emulator (warm)", ["android", "emulator", 0], False, None),
+            ("ios simulator (cold)", ["ios", "simulator", 0], True, None),
+            ("ios simulator (warm)", ["ios", "simulator", 0], False, None),
+            ("ios device (warm)", ["ios", "device", "universal", 0, 0, 0], False, None),
+            ("ios dist-adhoc (warm)", ["ios", "dist-adhoc", "universal", 0, 0], False, None),
+            ("mobileweb", ["mobileweb", "development"], False, None),
+            ("clean", ["clean"], False, None)
+        ]
+        #The plugin prints the commands it runs, which would drown out the results
+        for name, answers, cold, kwargs in builds:
+            with contextlib.redirect_stdout(io.StringIO()):
+                times = time_build(sublime, Titanium, folder, answers, args.repeat, cold, kwargs)
+            lines.append(format_times(name, times))
+            print(lines[-1])
+
+        #Presets are saved from the most recent build, which is the clean build above, so save one explicitly
+        Titanium.save_project_preset(folder, "bench", {"platform": "android", "target": "emulator", "deviceID": "Emulator_0", "deviceName": "Emulator_0"})
+        with contextlib.redirect_stdout(io.StringIO()):
+            times = time_build(sublime, Titanium, folder, [], args.repeat, True, {"preset": "bench"})
+        lines.append(format_times("android emulator preset (cold)", times))
+        print(lines[-1])
+
+        lines.extend(["", "  %-42s %11s %11s %11s" % ("helpers", "min", "median", "max")])
+        print("\n".join(lines[-2:]))
+        iosJson = json.dumps({"ios": fake_appc.ios_info()}, indent=2).encode("utf-8")
+        selector = Titanium.ENVIRONMENT_SELECTORS["ios"]
+        info = Titanium.JsonStreamReader(io.BytesIO(iosJson)).parse(selector)
+        env = Titanium.parse_ios_info(info["ios"])
+        Titanium.write_environment_cache(FAKE_APPC, "bench", "ios", env)
+        repeat = max(args.repeat, 10)
+        completionIndex = Titanium.read_completion_index(Titanium.COMPLETIONS_FILE)
+        completionIndexPath = os.path.join(root, "completions.index")
+        completionIndex.write(completionIndexPath)
+        completionIndexFile = Titanium.CompletionIndexFile(completionIndexPath)
+        styleSheet = "".join('"#item%d": {\n  top: %d,\n  width: Ti.UI.FILL,\n  font: { fontSize: 14 }\n},\n' % (i, i) for i in range(5000))
+        editedStyleSheet = styleSheet[:len(styleSheet) // 2] + "x" + styleSheet[len(styleSheet) // 2:]
+        def update_style_sheet():
+            document = Titanium.TssDocument()
+            document.update(styleSheet)
+            return lambda: (document.update(editedStyleSheet), document.update(styleSheet))
+        updateStyleSheet = update_style_sheet()
+        buildOutput = ["[TRACE] Copying %s/Resources/images/icon%d.png => build/android/assets/icon%d.png\n" % (folder, i, i) for i in range(10000)]
+        def add_build_phases():
+            phases = Titanium.BuildPhases()
+            for line in buildOutput:
+                phases.add(line, 0)
+
+        helpers = [
+            ("json.loads ti info (%.1f MB)" % (len(iosJson) / 1e6), lambda: json.loads(iosJson.decode("utf-8"))),
+            ("JsonStreamReader ti info", lambda: Titanium.JsonStreamReader(io.BytesIO(iosJson)).parse(selector)),
+            ("parse_ios_info", lambda: Titanium.parse_ios_info(info["ios"])),
+            ("IosEnvironment.from_cache", lambda: Titanium.IosEnvironment.from_cache(env.to_cache())),
+            ("read_environment_cache", lambda: Titanium.read_environment_cache(FAKE_APPC, "bench", 86400, "ios")),
+            ("get_profile_options", lambda: env.get_profile_options("development", "com.example.app1")),
+            ("read_tiapp (uncached)", lambda: (Titanium.tiappCache.clear(), Titanium.read_tiapp(folder))),
+            ("read_tiapp (cached)", lambda: Titanium.read_tiapp(folder)),
+            ("read_completion_index", lambda: Titanium.read_completion_index(Titanium.COMPLETIONS_FILE)),
+            ("CompletionIndex.complete Ti.UI.Window", lambda: completionIndex.complete(["Ti", "UI", "Window"], "")),
+            ("CompletionIndex.complete Ti.UI.cre", lambda: completionIndex.complete(["Ti", "UI"], "cre")),
+            ("CompletionIndexFile open", lambda: Titanium.CompletionIndexFile(completionIndexPath)),
+            ("CompletionIndexFile.complete Ti.UI.Window", lambda: completionIndexFile.complete(["Ti", "UI", "Window"], "")),
+            ("TssDocument.update 5000 rules (full)", lambda: Titanium.TssDocument().update(styleSheet)),
+            ("TssDocument.update 5000 rules (2 edits)", updateStyleSheet),
+            ("BuildPhases.add 10000 lines", add_build_phases)
+        ]
+        for name, fn in helpers:
+            lines.append(format_times(name, time_call(fn, repeat)))
+            print(lines[-1])
+
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write("\n".join(lines) + "\n")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#A stand-in for the appc CLI, used by the benchmarks.
+#It answers the commands the plugin runs with synthetic data, after a configurable delay.
+#
+#Environment variables:
+#  FAKE_APPC_DELAY        seconds every command takes to start (default 0.5)
+#  FAKE_APPC_INFO_DELAY   extra seconds `ti info` takes (default 1.0)
+#  FAKE_APPC_SIMULATORS   number of ios simulators (default 50)
+#  FAKE_APPC_DEVICES      number of connected ios devices (default 2)
+#  FAKE_APPC_EMULATORS    number of android emulators (default 10)
+#  FAKE_APPC_PROFILES     number of provisioning profiles per category (default 100)
+#  FAKE_APPC_CERTS        number of certificates per category (default 5)
+#  FAKE_APPC_BUILD_LINES  number of lines `appc run` prints (default 100)
+#  FAKE_APPC_LOG          file that every command line is appended to
+#
+#`appc login` stores the session in ~/.fake-appc-session, and `appc whoami` reads it back.
+
+import json
+import os
+import sys
+import time
+from os.path import expanduser
+
+
+def setting(name, default):
+    return type(default)(os.environ.get("FAKE_APPC_" + name, default))
+
+def android_info():
+    emulators = []
+    for i in range(setting("EMULATORS", 10)):
+        emulators.append({
+            "id": "Emulator_" + str(i),
+            "name": "Emulator_" + str(i),
+            "type": "avd",
+            "sdk-version": "9.0",
+            "api-level": 28,
+            "abi": "x86",
+            "skin": "1080x1920",
+            "sdcard": expanduser("~") + "/.android/avd/Emulator_" + str(i) + ".avd/sdcard.img",
+            "googleApis": True
+        })
+    return {"sdks": {}, "emulators": emulators, "devices": [], "targets": {}}
+
+def profile(category, i):
+    return {
+        "uuid": category + "-" + str(i),
+        "name": category.title() + " Profile " + str(i),
+        "appPrefix": "TEAM",
+        "appId": "com.example.app" + str(i % 10) if i % 3 else "*",
+        "creationDate": "2019-01-01T00:00:00.000Z",
+        "expirationDate": "2030-01-01T00:00:00.000Z",
+        "expired": i % 20 == 19,
+        "certs": ["MIIFmDCCBICgAwIBAgIIV" * 80],
+        "devices": ["0123456789abcdef0123456789abcdef0123%04d" % d for d in range(50)],
+        "entitlements": dict(("com.apple.developer.entitlement-" + str(e), "TEAM.com.example.*") for e in range(30)),
+        "team": ["TEAM"]
+    }
+
+def ios_info():
+    home = expanduser("~")
+    simulators = {}
+    for i in range(setting("SIMULATORS", 50)):
+        version = "12." + str(i % 4)
+        simulators.setdefault(version, []).append({
+            "udid": "SIMULATOR-" + str(i),
+            "name": "iPhone " + str(i),
+            "deviceName": "iPhone " + str(i),
+            "version": version,
+            "type": "iphone",
+            "state": "Shutdown",
+            "deviceType": "com.apple.CoreSimulator.SimDeviceType.iPhone-X",
+            "runtime": "com.apple.CoreSimulator.SimRuntime.iOS-12-0",
+            "logPaths": [home + "/Library/Logs/CoreSimulator/SIMULATOR-" + str(i)],
+            "dataDir": home + "/Library/Developer/CoreSimulator/Devices/SIMULATOR-" + str(i) + "/data"
+        })
+
+    devices = []
+    for i in range(setting("DEVICES", 2)):
+        devices.append({
+            "udid": "DEVICE-" + str(i),
+            "name": "Test Device " + str(i),
+            "deviceClass": "iphone" if i % 2 == 0 else "ipad",
+            "productType": "iPhone10,3",
+            "productVersion": "12.1",
+            "buildVersion": "16B92",
+            "cpuArchitecture": "arm64"
+        })
+
+    def certs(kind):
+        return [{
+            "name": "Example Developer " + str(i) + " (TEAM)",
+            "fullname": "iPhone " + kind + ": Example Developer " + str(i) + " (TEAM)",
+            "pem": "-----BEGIN CERTIFICATE-----" + "MIIFmDCCBICgAwIBAgIIV" * 80,
+            "before": "2019-01-01T00:00:00.000Z",
+            "after": "2030-01-01T00:00:00.000Z",
+            "expired": False,
+            "invalid": False
+        } for i in range(setting("CERTS", 5))]
+
+    profiles = setting("PROFILES", 100)
+    return {
+        "xcode": {"10.1": {"path": "/Applications/Xcode.app", "sdks": ["12.1"], "sims": ["12.1"]}},
+        "certs": {"keychains": {home + "/Library/Keychains/login.keychain": {"developer": certs("Developer"), "distribution": certs("Distribution")}}, "wwdr": True},
+        "provisioning": dict((category, [profile(category, i) for i in range(profiles)]) for category in ["development", "distribution", "adhoc"]),
+        "devices": devices,
+        "simulators": {"ios": simulators, "watchos": {}},
+        "teams": {"TEAM": {"name": "Example"}}
+    }
+
+def tiapp_value(args, tag):
+    folder = args[args.index("--project-dir") + 1]
+    with open(os.path.join(folder, "tiapp.xml")) as f:
+        text = f.read()
+    start = text.find("<" + tag + ">")
+    end = text.find("</" + tag + ">")
+    if start < 0 or end < 0:
+        return ""
+    return text[start + len(tag) + 2:end].strip()
+
+def session_file():
+    return os.path.join(expanduser("~"), ".fake-appc-session")
+
+def main(args):
+    log = os.environ.get("FAKE_APPC_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(" ".join(args) + "\n")
+
+    time.sleep(setting("DELAY", 0.5))
+
+    if args[:1] == ["login"]:
+        with open(session_file(), "w") as f:
+            f.write(args[args.index("--username") + 1])
+        print("Logged in")
+    elif args[:1] == ["whoami"]:
+        if os.path.isfile(session_file()):
+            with open(session_file()) as f:
+                json.dump({"username": f.read()}, sys.stdout)
+        else:
+            json.dump({}, sys.stdout)
+    elif args[:2] == ["ti", "info"]:
+        time.sleep(setting("INFO_DELAY", 1.0))
+        info = {}
+        platform = args[args.index("-t") + 1] if "-t" in args else None
+        if platform in (None, "android"):
+            info["android"] = android_info()
+        if platform in (None, "ios"):
+            info["ios"] = ios_info()
+        json.dump(info, sys.stdout, indent=2)
+    elif args[:3] == ["ti", "project", "sdk-version"]:
+        print(tiapp_value(args, "sdk-version"))
+    elif args[:3] == ["ti", "project", "version"]:
+        print(tiapp_value(args, "version"))
+    elif args[:1] == ["run"] or args[:2] == ["ti", "clean"]:
+        for i in range(setting("BUILD_LINES", 100)):
+            print("[INFO]  Build line " + str(i))
+            sys.stdout.flush()
+    else:
+        print("OK")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
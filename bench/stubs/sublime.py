@@ -0,0 +1,263 @@
+#A minimal, headless stand-in for Sublime Text's sublime module, used by the benchmarks.
+#Timeouts run on a simple event loop (see run_until), and quick panels and input panels
+#are answered automatically from Window.answers.
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+cachePath = None
+packagesPath = None
+statusMessages = []
+errorMessages = []
+
+timeouts = []
+timeoutCounter = itertools.count()
+timeoutLock = threading.Lock()
+
+settingsFiles = {}
+windowList = []
+
+
+def cache_path():
+    return cachePath
+
+def packages_path():
+    return packagesPath
+
+def set_timeout(callback, delay=0):
+    with timeoutLock:
+        heapq.heappush(timeouts, (time.time() + delay / 1000.0, next(timeoutCounter), callback))
+
+def set_timeout_async(callback, delay=0):
+    timer = threading.Timer(delay / 1000.0, callback)
+    timer.daemon = True
+    timer.start()
+
+#Runs the timeouts that are due until predicate() is true, or the timeout (in seconds) expires.
+#Returns whether the predicate became true
+def run_until(predicate, timeout=60):
+    end = time.time() + timeout
+    while not predicate():
+        if time.time() > end:
+            return False
+        callback = None
+        with timeoutLock:
+            if len(timeouts) > 0 and timeouts[0][0] <= time.time():
+                callback = heapq.heappop(timeouts)[2]
+        if callback is not None:
+            callback()
+        else:
+            time.sleep(0.001)
+    return True
+
+def status_message(message):
+    statusMessages.append(message)
+
+def error_message(message):
+    errorMessages.append(message)
+
+def message_dialog(message):
+    statusMessages.append(message)
+
+def ok_cancel_dialog(message, ok_title=""):
+    return True
+
+def active_window():
+    return windowList[-1] if len(windowList) > 0 else None
+
+def windows():
+    return list(windowList)
+
+def load_resource(name):
+    #Resources are read from the package folder this stub lives under
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(os.path.join(root, name.split("/", 2)[-1]), "r") as f:
+        return f.read()
+
+def load_settings(name):
+    if name not in settingsFiles:
+        settingsFiles[name] = Settings()
+    return settingsFiles[name]
+
+def save_settings(name):
+    pass
+
+
+class Settings(object):
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def has(self, key):
+        return key in self.values
+
+    def add_on_change(self, tag, callback):
+        pass
+
+    def clear_on_change(self, tag):
+        pass
+
+
+class Region(object):
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def contains(self, point):
+        return self.begin() <= point <= self.end()
+
+
+class View(object):
+
+    def __init__(self, window=None, text=""):
+        self.parentWindow = window
+        self.text = text
+        self.name = ""
+        self.viewSettings = Settings()
+        self.regions = {}
+        self.fileName = None
+        self.statuses = {}
+
+    def window(self):
+        return self.parentWindow
+
+    def set_status(self, key, value):
+        self.statuses[key] = value
+
+    def erase_status(self, key):
+        self.statuses.pop(key, None)
+
+    def id(self):
+        return id(self)
+
+    def file_name(self):
+        return self.fileName
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        if isinstance(region, Region):
+            return self.text[region.begin():region.end()]
+        return self.text[region]
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_read_only(self, readOnly):
+        pass
+
+    def assign_syntax(self, syntax):
+        pass
+
+    def settings(self):
+        return self.viewSettings
+
+    def add_regions(self, key, regions, *args, **kwargs):
+        self.regions[key] = regions
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def show(self, location, *args, **kwargs):
+        pass
+
+    def sel(self):
+        return []
+
+    def match_selector(self, point, selector):
+        return False
+
+    def run_command(self, name, args=None):
+        if name == "append":
+            self.text += args["characters"]
+
+
+class Window(object):
+
+    #answers holds the answers to the next panels, in order. An answer is an index,
+    #a string that is picked from the panel's items, or the text to enter in an input panel.
+    #When there are no answers left, quick panels pick their first item
+    def __init__(self, folders):
+        self.windowFolders = folders
+        self.answers = []
+        self.commands = []
+        self.panels = {}
+        self.viewList = []
+        windowList.append(self)
+
+    def id(self):
+        return id(self)
+
+    def folders(self):
+        return self.windowFolders
+
+    def project_data(self):
+        return {"folders": [{"path": folder, "name": os.path.basename(folder)} for folder in self.windowFolders]}
+
+    def active_view(self):
+        return self.viewList[-1] if len(self.viewList) > 0 else None
+
+    def views(self):
+        return self.viewList
+
+    def new_file(self):
+        view = View(self)
+        self.viewList.append(view)
+        return view
+
+    def open_file(self, path, flags=0):
+        view = View(self)
+        view.fileName = path
+        self.viewList.append(view)
+        return view
+
+    def show_quick_panel(self, items, done, *args, **kwargs):
+        if done is None:
+            return
+        answer = self.answers.pop(0) if len(self.answers) > 0 else 0
+        if not isinstance(answer, int):
+            titles = [item[0] if isinstance(item, list) else item for item in items]
+            answer = [i for i, title in enumerate(titles) if answer in title][0]
+        done(answer)
+
+    def show_input_panel(self, caption, text, done, change, cancel):
+        done(self.answers.pop(0) if len(self.answers) > 0 else text)
+
+    def create_output_panel(self, name, unlisted=False):
+        self.panels[name] = View(self)
+        return self.panels[name]
+
+    def find_output_panel(self, name):
+        return self.panels.get(name)
+
+    def run_command(self, name, args=None):
+        self.commands.append((time.time(), name, args))
+
+    def status_message(self, message):
+        status_message(message)
@@ -0,0 +1,32 @@
+#Tests of the build timing helpers, run against the headless sublime stubs of the benchmarks:
+#python3 -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+PACKAGE_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PACKAGE_FOLDER, "bench", "stubs"))
+sys.path.insert(0, PACKAGE_FOLDER)
+
+import Titanium
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual(Titanium.percentile(values, 50), 5)
+        self.assertEqual(Titanium.percentile(values, 90), 9)
+        self.assertEqual(Titanium.percentile(values, 99), 10)
+        self.assertEqual(Titanium.percentile(values, 100), 10)
+
+    def test_small_lists(self):
+        self.assertEqual(Titanium.percentile([1, 2], 50), 1)
+        self.assertEqual(Titanium.percentile([1, 2], 51), 2)
+        self.assertEqual(Titanium.percentile([7], 50), 7)
+        self.assertEqual(Titanium.percentile([1, 2, 3], 0), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()